@@ -0,0 +1,106 @@
+# vim: set et sw=4 sts=4 fileencoding=utf-8:
+#
+# Raspberry Pi Sense HAT Emulator library for the Raspberry Pi
+# Copyright (c) 2016 Raspberry Pi Foundation <info@raspberrypi.org>
+#
+# This package is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This package is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see <http://www.gnu.org/licenses/>
+
+"""
+Benchmark one tick of the IMU's simulated world (IMUServer._world_write),
+which the emulator runs 59.5 times a second while it's idle.
+
+Each tick is timed with the world simulation on (noise and smoothing) and
+off, with the orientation held still and changing on every tick; the memory
+allocated (and not freed) per tick is also reported. The ticks are only run
+by the benchmark (the scheduler's job is held even when the simulation is on),
+and the benchmark uses its own emulator instance so it doesn't disturb a
+running emulator. Run it with the package installed (e.g. by "make
+develop")::
+
+    python bench/imu_tick.py [ticks]
+"""
+
+import os
+import sys
+import tracemalloc
+from time import perf_counter
+
+from sense_emu.imu import IMUServer
+from sense_emu.segment import segment_filename
+
+
+INSTANCE = 'bench'
+
+
+def simulate(imu, value):
+    # Switch the world simulation on or off, but stop the scheduler running
+    # its ticks; _world_write still takes the simulation's path while the
+    # job is set
+    imu.simulate_world = value
+    if value:
+        imu._world_job.cancel()
+
+
+def bench(imu, ticks, changing):
+    start = perf_counter()
+    for tick in range(ticks):
+        if changing:
+            imu._orientation = (float(tick % 90), 0.0, 0.0)
+        imu._world_write()
+    return (perf_counter() - start) / ticks
+
+
+def leaked(imu, ticks):
+    # The noise generator refills a block of values whenever it runs out, so
+    # the ticks measured are rounded to a multiple of the block's size (each
+    # tick draws the same number of values, so the generator ends as it
+    # started). Tracing starts a block's worth of ticks early so that the
+    # block in use at the start was allocated while tracing, like its
+    # replacement at the end
+    block = imu._noise._size
+    ticks = max(1, -(-ticks // block)) * block
+    tracemalloc.start()
+    try:
+        for tick in range(block):
+            imu._world_write()
+        before = tracemalloc.get_traced_memory()[0]
+        for tick in range(ticks):
+            imu._world_write()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return (after - before) / ticks
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    ticks = int(args[0]) if args else 20000
+    imu = IMUServer(simulate_world=False, seed=1, instance=INSTANCE)
+    try:
+        for value in (False, True):
+            simulate(imu, value)
+            for changing in (False, True):
+                print('simulate_world=%-5s orientation=%-8s %6.1fus/tick' % (
+                    value, 'changing' if changing else 'still',
+                    bench(imu, ticks, changing) * 1000000))
+            print('simulate_world=%-5s retained %.1f bytes/tick' % (
+                value, leaked(imu, ticks // 10)))
+    finally:
+        imu.close()
+        os.unlink(segment_filename(INSTANCE))
+
+
+if __name__ == '__main__':
+    main()
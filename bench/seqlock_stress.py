@@ -0,0 +1,127 @@
+# vim: set et sw=4 sts=4 fileencoding=utf-8:
+#
+# Raspberry Pi Sense HAT Emulator library for the Raspberry Pi
+# Copyright (c) 2016 Raspberry Pi Foundation <info@raspberrypi.org>
+#
+# This package is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This package is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see <http://www.gnu.org/licenses/>
+
+"""
+Stress the sequence locks protecting the shared segment: one process writes
+the IMU's registers as fast as it can while hundreds of reader threads (spread
+over several processes) read them.
+
+Every write fills the registers with a single value, so a read which returns
+differing values is torn. Half the readers go through the segment's
+SeqLock, and half read the registers directly for comparison; the former
+must never see a torn read (the script exits with status 1 if they do). The
+benchmark uses its own emulator instance so it doesn't disturb a running
+emulator. Run it with the package installed (e.g. by "make develop")::
+
+    python bench/seqlock_stress.py [seconds [processes [threads]]]
+"""
+
+import os
+import sys
+import multiprocessing as mp
+from threading import Thread
+from time import monotonic
+
+from sense_emu.imu import IMU_WORLD, IMU_WORLD_OFFSET
+from sense_emu.segment import open_segment, segment_filename
+
+
+INSTANCE = 'bench'
+
+
+def writer(stop):
+    segment = open_segment(INSTANCE)
+    segment.start_writer()
+    try:
+        seqlock = segment.seqlock('imu')
+        value = 0
+        while not stop.is_set():
+            value = (value + 1) % 30000
+            seqlock.pack_into(
+                IMU_WORLD, IMU_WORLD_OFFSET, value, *([value] * 12))
+    finally:
+        segment.stop_writer()
+
+
+def reader(duration, threads, results):
+    segment = open_segment(INSTANCE)
+    registers = segment.region('imu')
+    seqlock = segment.seqlock('imu')
+    counts = []
+
+    def run(locked):
+        reads = torn = 0
+        end = monotonic() + duration
+        while monotonic() < end:
+            if locked:
+                values = seqlock.unpack_from(IMU_WORLD, IMU_WORLD_OFFSET)
+            else:
+                values = IMU_WORLD.unpack_from(registers, IMU_WORLD_OFFSET)
+            reads += 1
+            if len(set(values)) != 1:
+                torn += 1
+        counts.append((locked, reads, torn))
+
+    workers = [Thread(target=run, args=(i % 2 == 0,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    results.put(counts)
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    duration = float(args[0]) if len(args) > 0 else 3.0
+    processes = int(args[1]) if len(args) > 1 else 8
+    threads = int(args[2]) if len(args) > 2 else 32
+    # Create the segment before any of the processes use it
+    open_segment(INSTANCE)
+    stop = mp.Event()
+    results = mp.Queue()
+    write_proc = mp.Process(target=writer, args=(stop,))
+    write_proc.start()
+    read_procs = [
+        mp.Process(target=reader, args=(duration, threads, results))
+        for i in range(processes)
+        ]
+    try:
+        for proc in read_procs:
+            proc.start()
+        counts = [count for proc in read_procs for count in results.get()]
+        for proc in read_procs:
+            proc.join()
+    finally:
+        stop.set()
+        write_proc.join()
+        os.unlink(segment_filename(INSTANCE))
+    failed = False
+    for locked in (True, False):
+        selected = [count for count in counts if count[0] == locked]
+        reads = sum(count[1] for count in selected)
+        torn = sum(count[2] for count in selected)
+        print('%-7s readers=%-4d reads=%-9d torn=%d' % (
+            'seqlock' if locked else 'direct', len(selected), reads, torn))
+        if locked and torn:
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -147,6 +147,7 @@ man_pages = [
     ('sense_rec',      'sense_rec',      'Sense HAT data recorder',       [info['author']], 1),
     ('sense_play',     'sense_play',     'Sense HAT emulator playback',   [info['author']], 1),
     ('sense_csv',      'sense_csv',      'Sense HAT CSV conversion tool', [info['author']], 1),
+    ('sense_screen_rec', 'sense_screen_rec', 'Sense HAT emulator screen recorder', [info['author']], 1),
 ]
 
 #man_show_urls = False
@@ -16,14 +16,20 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>
 
-import mmap
 from time import time
 
 import numpy as np
 
-from .pressure import init_pressure, PRESSURE_DATA, PressureData, PRESSURE_FACTOR, TEMP_FACTOR, TEMP_OFFSET
-from .humidity import init_humidity, HUMIDITY_DATA, HumidityData
-from .imu import init_imu, IMU_DATA, IMUData, ACCEL_FACTOR, GYRO_FACTOR, COMPASS_FACTOR, ORIENT_FACTOR
+from .segment import open_segment
+from .pressure import (
+    PressureServer, PRESSURE_DATA, PressureData, PRESSURE_OUT,
+    PRESSURE_OUT_OFFSET, PRESSURE_FACTOR, TEMP_FACTOR, TEMP_OFFSET)
+from .humidity import (
+    HumidityServer, HUMIDITY_DATA, HumidityData, HUMIDITY_OUT,
+    HUMIDITY_OUT_OFFSET)
+from .imu import (
+    IMU_DATA, IMUData, IMU_WORLD, IMU_WORLD_OFFSET, ACCEL_FACTOR,
+    GYRO_FACTOR, COMPASS_FACTOR, ORIENT_FACTOR)
 
 
 class Settings:
@@ -32,11 +38,10 @@ class Settings:
 
 
 class RTIMU:
-    def __init__(self, settings):
+    def __init__(self, settings, instance=None):
         self.settings = settings
-        self._fd = init_imu()
-        self._map = mmap.mmap(self._fd.fileno(), 0, access=mmap.ACCESS_READ)
-        self._last_data = None
+        self._seqlock = open_segment(instance).seqlock('imu')
+        self._last_timestamp = None
         self._imu_data = {
             'accel':            (0.0, 0.0, 0.0),
             'accelValid':       False,
@@ -64,7 +69,7 @@ class RTIMU:
             gx, gy, gz,
             cx, cy, cz,
             ox, oy, oz,
-            ) = IMU_DATA.unpack_from(self._map)
+            ) = self._seqlock.unpack_from(IMU_DATA)
         return IMUData(
             type, name, timestamp,
             np.array((ax, ay, az)),
@@ -74,8 +79,9 @@ class RTIMU:
             )
 
     def IMUInit(self):
-        self._last_data = self._read()
-        return self._last_data.type != 0
+        data = self._read()
+        self._last_timestamp = data.timestamp
+        return data.type != 0
 
     def IMUGetPollInterval(self):
         return 10 # 3 on the actual board
@@ -84,21 +90,32 @@ class RTIMU:
         raise NotImplementedError
 
     def IMURead(self):
-        data = self._read()
-        if data.timestamp == self._last_data.timestamp:
+        # Only the registers that change are read, and scaled with scalar
+        # arithmetic
+        (
+            timestamp,
+            ax, ay, az,
+            gx, gy, gz,
+            cx, cy, cz,
+            ox, oy, oz,
+            ) = self._seqlock.unpack_from(IMU_WORLD, IMU_WORLD_OFFSET)
+        if timestamp == self._last_timestamp:
             return False
         else:
-            self._last_data = data
+            self._last_timestamp = timestamp
             self._imu_data = {
-                'accel':            tuple(data.accel / ACCEL_FACTOR),
+                'accel':            (ax / ACCEL_FACTOR, ay / ACCEL_FACTOR, az / ACCEL_FACTOR),
                 'accelValid':       True,
-                'compass':          tuple((data.compass / COMPASS_FACTOR) * 100), # convert Gauss to uT
+                'compass':          ( # convert Gauss to uT
+                    cx / COMPASS_FACTOR * 100,
+                    cy / COMPASS_FACTOR * 100,
+                    cz / COMPASS_FACTOR * 100),
                 'compassValid':     True,
-                'fusionPose':       tuple(data.orient / ORIENT_FACTOR),
+                'fusionPose':       (ox / ORIENT_FACTOR, oy / ORIENT_FACTOR, oz / ORIENT_FACTOR),
                 'fusionPoseValid':  True,
                 'fusionQPose':      (0.0, 0.0, 0.0, 0.0),
                 'fusionQPoseValid': False,
-                'gyro':             tuple(data.gyro / GYRO_FACTOR),
+                'gyro':             (gx / GYRO_FACTOR, gy / GYRO_FACTOR, gz / GYRO_FACTOR),
                 'gyroValid':        True,
                 'humidity':         float('nan'),
                 'humidityValid':    False,
@@ -106,7 +123,7 @@ class RTIMU:
                 'pressureValid':    False,
                 'temperature':      float('nan'),
                 'temperatureValid': False,
-                'timestamp':        data.timestamp,
+                'timestamp':        timestamp,
                 }
             return True
 
@@ -160,19 +177,23 @@ class RTIMU:
 
 
 class RTPressure(object):
-    def __init__(self, settings):
+    def __init__(self, settings, instance=None):
         self.settings = settings
-        self._fd = init_pressure()
-        self._map = mmap.mmap(self._fd.fileno(), 0, access=mmap.ACCESS_READ)
+        self._seqlock = open_segment(instance).seqlock('pressure')
         self._last_read = 0.0
         self._last_data = None
         self._p_ref = None
 
     def _read(self):
+        return PressureData(*self._seqlock.unpack_from(PRESSURE_DATA))
+
+    def _read_output(self):
+        # The sensor's output only changes once per interval so there's no
+        # point reading it more often than that
         now = time()
-        if now - self._last_read > 0.04:
+        if now - self._last_read > PressureServer.interval:
             self._last_read = now
-            self._last_data = PressureData(*PRESSURE_DATA.unpack_from(self._map))
+            self._last_data = self._seqlock.unpack_from(PRESSURE_OUT, PRESSURE_OUT_OFFSET)
         return self._last_data
 
     def pressureInit(self):
@@ -184,10 +205,10 @@ class RTPressure(object):
         if self._p_ref is None:
             return (0, 0.0, 0, 0.0)
         else:
-            d = self._read()
+            p_out, t_out, p_valid, t_valid = self._read_output()
             return (
-                d.P_VALID, d.P_OUT / PRESSURE_FACTOR,
-                d.T_VALID, d.T_OUT / TEMP_FACTOR + TEMP_OFFSET,
+                p_valid, p_out / PRESSURE_FACTOR,
+                t_valid, t_out / TEMP_FACTOR + TEMP_OFFSET,
                 )
 
     def pressureType(self):
@@ -198,10 +219,9 @@ class RTPressure(object):
 
 
 class RTHumidity(object):
-    def __init__(self, settings):
+    def __init__(self, settings, instance=None):
         self.settings = settings
-        self._fd = init_humidity()
-        self._map = mmap.mmap(self._fd.fileno(), 0, access=mmap.ACCESS_READ)
+        self._seqlock = open_segment(instance).seqlock('humidity')
         self._last_read = 0.0
         self._last_data = None
         self._humidity_m = None
@@ -210,10 +230,15 @@ class RTHumidity(object):
         self._temp_c = None
 
     def _read(self):
+        return HumidityData(*self._seqlock.unpack_from(HUMIDITY_DATA))
+
+    def _read_output(self):
+        # The sensor's output only changes once per interval so there's no
+        # point reading it more often than that
         now = time()
-        if now - self._last_read > 0.13:
+        if now - self._last_read > HumidityServer.interval:
             self._last_read = now
-            self._last_data = HumidityData(*HUMIDITY_DATA.unpack_from(self._map))
+            self._last_data = self._seqlock.unpack_from(HUMIDITY_OUT, HUMIDITY_OUT_OFFSET)
         return self._last_data
 
     def humidityInit(self):
@@ -231,10 +256,10 @@ class RTHumidity(object):
         if self._temp_m is None:
             return (0, 0.0, 0, 0.0)
         else:
-            d = self._read()
+            h_out, t_out, h_valid, t_valid = self._read_output()
             return (
-                d.H_VALID, d.H_OUT * self._humidity_m + self._humidity_c,
-                d.T_VALID, d.T_OUT * self._temp_m + self._temp_c,
+                h_valid, h_out * self._humidity_m + self._humidity_c,
+                t_valid, t_out * self._temp_m + self._temp_c,
                 )
 
     def humidityType(self):
@@ -21,6 +21,8 @@
 import sys
 
 from .sense_hat import SenseHat, SenseHat as AstroPi
+from .animation import FramePlayer
+from .segment import live_instances
 from .stick import (
     SenseStick,
     InputEvent,
@@ -85,6 +87,7 @@ __entry_points__ = {
         'sense_rec = sense_emu.record:app',
         'sense_play = sense_emu.play:app',
         'sense_csv = sense_emu.dump:app',
+        'sense_screen_rec = sense_emu.screen_record:app',
         ],
     'gui_scripts': [
         'sense_emu_gui = sense_emu.gui:main',
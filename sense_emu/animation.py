@@ -0,0 +1,130 @@
+# vim: set et sw=4 sts=4 fileencoding=utf-8:
+#
+# Raspberry Pi Sense HAT Emulator library for the Raspberry Pi
+# Copyright (c) 2016 Raspberry Pi Foundation <info@raspberrypi.org>
+#
+# This package is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This package is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>
+
+from time import monotonic
+from threading import Thread, Event, current_thread
+from concurrent.futures import Future
+
+
+class FramePlayer:
+    """
+    Draws a sequence of frames on the LED matrix from a background thread.
+    Instances of this class are returned by methods like
+    :meth:`SenseHat.show_message`; you should never need to construct one
+    yourself.
+
+    Each frame is drawn at a fixed deadline measured from the start of play
+    with a monotonic clock, so delays in drawing one frame don't accumulate.
+    If drawing falls so far behind that the next frame is already due, the
+    late frame is skipped (see :attr:`dropped`).
+
+    Waiting for the frames to finish can be done with :meth:`wait`, or by
+    awaiting the instance from a coroutine.
+    """
+
+    def __init__(self, draw, frames, interval):
+        self._draw = draw
+        self._frames = frames
+        self._interval = interval
+        self._dropped = 0
+        self._cancelled = False
+        self._stop = Event()
+        self._future = Future()
+        self._thread = Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __await__(self):
+        import asyncio
+        return asyncio.wrap_future(self._future).__await__()
+
+    def _run(self):
+        try:
+            start = monotonic()
+            deadline = start
+            for frame in self._frames:
+                now = monotonic()
+                if self._interval and now >= deadline + self._interval:
+                    # We're so far behind that the next frame is already
+                    # due; skip this one
+                    self._dropped += 1
+                else:
+                    if self._stop.wait(deadline - now):
+                        self._cancelled = True
+                        break
+                    self._draw(frame)
+                deadline += self._interval
+            else:
+                # Hold the last frame for its interval, like every other frame
+                self._cancelled = self._stop.wait(max(0, deadline - monotonic()))
+        except Exception as e:
+            self._future.set_exception(e)
+        else:
+            self._future.set_result(None)
+
+    def cancel(self):
+        """
+        Stop drawing frames as soon as possible. The LED matrix is left
+        displaying whichever frame was last drawn. Returns ``False`` if the
+        player had already finished (in which case it isn't marked as
+        :attr:`cancelled`), or ``True`` otherwise.
+        """
+        if self._future.done():
+            return False
+        self._stop.set()
+        if self._thread is current_thread():
+            # Called from draw; the player stops after it returns
+            return True
+        self._thread.join()
+        return self._cancelled
+
+    def wait(self, timeout=None):
+        """
+        Wait up to *timeout* seconds (indefinitely if *timeout* is ``None``)
+        for all frames to be drawn, or for the player to be cancelled.
+        Returns ``True`` if the player finished, or ``False`` if the timeout
+        expired. If drawing raised an exception, it is re-raised here.
+        """
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            return False
+        self._future.result()
+        return True
+
+    @property
+    def done(self):
+        """
+        Returns ``True`` if all frames have been drawn, or the player was
+        cancelled.
+        """
+        return self._future.done()
+
+    @property
+    def cancelled(self):
+        """
+        Returns ``True`` if the player was cancelled with :meth:`cancel` before
+        it finished.
+        """
+        return self._cancelled
+
+    @property
+    def dropped(self):
+        """
+        The number of frames which were skipped because drawing fell behind.
+        """
+        return self._dropped
@@ -17,10 +17,18 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>
 
 import io
+import os
+import re
+import sys
+import mmap
 import errno
+import warnings
+from time import sleep, monotonic
 from struct import Struct
 from collections import namedtuple
 
+import numpy as np
+
 
 # Structures for sense_rec and sense_play
 HEADER_REC = Struct(
@@ -53,6 +61,297 @@ DataRecord = namedtuple('DataRecord', (
 ))
 
 
+# A NumPy equivalent of DATA_REC (which is entirely doubles)
+DATA_DTYPE = np.dtype([(field, np.float64) for field in DataRecord._fields])
+assert DATA_DTYPE.itemsize == DATA_REC.size
+
+
+class Recording:
+    """
+    A read-only, memory-mapped view of the sense_rec recording *filename*.
+    Records are not parsed until they are accessed, so opening even
+    multi-hour recordings is instant, and :meth:`index` locates the record
+    at any time offset with a binary search of the recorded timestamps.
+
+    An incomplete record at the end of the file (as written if the recorder
+    was terminated mid-write) is ignored.
+    """
+    def __init__(self, filename):
+        self.name = filename
+        with io.open(filename, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < HEADER_REC.size:
+                raise IOError('%s is not a Sense HAT recording' % filename)
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, ver, self.timestamp = HEADER_REC.unpack_from(self._map)
+        if magic != b'SENSEHAT':
+            self.close()
+            raise IOError('%s is not a Sense HAT recording' % filename)
+        if ver != 1:
+            self.close()
+            raise IOError('%s has unrecognized file version number' % filename)
+        self._records = np.frombuffer(
+            self._map, dtype=DATA_DTYPE, offset=HEADER_REC.size,
+            count=(size - HEADER_REC.size) // DATA_REC.size)
+        self._timestamps = self._records['timestamp']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._map is not None:
+            # The mapping can't be closed while NumPy views of it exist
+            self._records = None
+            self._timestamps = None
+            self._map.close()
+            self._map = None
+
+    def __len__(self):
+        return len(self._records)
+
+    def __getitem__(self, index):
+        """
+        Return the :class:`DataRecord` at *index*. Its timestamp is the
+        offset in seconds from the start of the recording.
+        """
+        data = DataRecord(*self._records[index].item())
+        return data._replace(timestamp=data.timestamp - self.timestamp)
+
+    @property
+    def duration(self):
+        """
+        The time in seconds from the start of the recording to its last
+        record.
+        """
+        if len(self._records):
+            return max(0.0, self._timestamps[-1] - self.timestamp)
+        else:
+            return 0.0
+
+    def index(self, offset):
+        """
+        Return the index of the first record at or after *offset* seconds
+        from the start of the recording (which is the length of the recording
+        if there is no such record).
+        """
+        return int(np.searchsorted(
+            self._timestamps, self.timestamp + offset, side='left'))
+
+
+class GaussianNoise:
+    """
+    A source of normally distributed random values for simulating sensor
+    noise. Values are drawn from a :class:`numpy.random.Generator`, seeded
+    with *seed* (if this is ``None``, the seed is unpredictable), in blocks of
+    *block* values to keep the cost of each draw to a minimum.
+
+    Each sensor server has its own instance, so no locking is required.
+    """
+    def __init__(self, seed=None, block=1024):
+        self._generator = np.random.default_rng(seed)
+        self._size = block
+        self._block = None
+        self._floats = None
+        self._index = block
+
+    def _refill(self, count):
+        remaining = self._block[self._index:] if self._block is not None else ()
+        self._block = np.concatenate((
+            remaining, self._generator.standard_normal(max(count, self._size))))
+        self._floats = self._block.tolist()
+        self._index = 0
+
+    def gauss(self, mu, sigma):
+        """
+        Return a single value from the normal distribution with mean *mu* and
+        standard deviation *sigma* (like :meth:`random.Random.gauss`).
+        """
+        if self._index >= len(self._floats or ()):
+            self._refill(1)
+        value = self._floats[self._index]
+        self._index += 1
+        return mu + value * sigma
+
+    def normal(self, mu, sigma, count):
+        """
+        Return an array of *count* values from the normal distribution with
+        mean *mu* (which may be an array of *count* values) and standard
+        deviation *sigma*.
+        """
+        if self._block is None or self._index + count > len(self._block):
+            self._refill(count)
+        values = self._block[self._index:self._index + count]
+        self._index += count
+        return mu + values * sigma
+
+
+class MovingAverage:
+    """
+    The mean of the last *length* values passed to :meth:`update`, which are
+    all initially *value*. Values may be scalars or NumPy arrays (of the same
+    shape as *value*); arrays must not be modified after they're passed in.
+
+    The values are held in a ring buffer with a running sum, so each update
+    costs the same regardless of *length*. The sum is recalculated from the
+    buffer every *length* updates so that rounding errors don't accumulate,
+    and NaN values don't stick once they've left the buffer (scalar sums are
+    also recalculated whenever they're NaN).
+    """
+    def __init__(self, length, value):
+        if length < 1:
+            raise ValueError('length must be 1 or more')
+        self._length = length
+        self.reset(value)
+
+    def reset(self, value):
+        """
+        Fill the buffer with *value*.
+        """
+        self._scalar = np.ndim(value) == 0
+        if self._scalar:
+            value = float(value)
+        else:
+            value = np.array(value, dtype=float)
+        self._values = [value] * self._length
+        self._sum = value * self._length
+        self._index = 0
+
+    def update(self, value):
+        """
+        Add *value* to the buffer (replacing the oldest value) and return the
+        new mean.
+        """
+        i = self._index
+        if self._scalar:
+            self._sum += value - self._values[i]
+        else:
+            # The sum is never shared so it can be updated in place
+            self._sum -= self._values[i]
+            self._sum += value
+        self._values[i] = value
+        i += 1
+        if i == self._length:
+            i = 0
+        self._index = i
+        if i == 0 or (self._scalar and self._sum != self._sum):
+            self._sum = sum(self._values)
+        return self._sum / self._length
+
+    @property
+    def value(self):
+        """
+        The current mean of the buffer.
+        """
+        return self._sum / self._length
+
+    @property
+    def group_delay(self):
+        """
+        The delay (in updates) by which the moving average lags its input.
+        """
+        return (self._length - 1) / 2
+
+
+# Each device's registers are protected by a sequence number (held in the
+# device's entry in the shared segment). Writers increment it before and after
+# every update so it's odd while an update is in progress, and readers retry if
+# it changed while they were reading (a "seqlock"), so they never see a
+# mixture of two updates
+SEQUENCE = Struct(
+    '='  # native order, standard sizing
+    'Q'  # update sequence number
+)
+
+
+class SeqLock:
+    """
+    Reads and writes the registers in *registers* (a buffer such as a view of
+    a device's registers in the shared segment) consistently, with the
+    sequence number at *offset* in *map* (which defaults to *registers*). The
+    :meth:`pack_into` and :meth:`unpack_from` methods mirror those of
+    :class:`struct.Struct`.
+
+    Only one writer may use the mapping at a time (which the emulator lock
+    ensures); any number of readers may. If *alive* is given, it is called
+    (without arguments) when a read keeps overlapping writes, and must return
+    ``True`` if the writer is still alive (see
+    :attr:`~sense_emu.segment.Segment.writer`).
+    """
+    # The number of consecutive attempts at a read before checking whether
+    # the writer is still alive, and the time (in seconds) for which a live
+    # writer may keep a read from succeeding
+    retries = 1000
+    timeout = 5
+
+    def __init__(self, map, offset, registers=None, alive=None):
+        self._map = map
+        self._offset = offset
+        self._registers = map if registers is None else registers
+        self._alive = alive
+
+    @property
+    def sequence(self):
+        """
+        The current sequence number.
+        """
+        return SEQUENCE.unpack_from(self._map, self._offset)[0]
+
+    def pack_into(self, struct, offset, *values):
+        """
+        Pack *values* with *struct* at *offset* in the registers, incrementing
+        the sequence number around the write.
+        """
+        sequence = SEQUENCE.unpack_from(self._map, self._offset)[0] | 1
+        SEQUENCE.pack_into(self._map, self._offset, sequence)
+        struct.pack_into(self._registers, offset, *values)
+        SEQUENCE.pack_into(self._map, self._offset, sequence + 1)
+
+    def unpack_from(self, struct, offset=0):
+        """
+        Unpack values with *struct* from *offset* in the registers, retrying
+        until no write overlapped the read (see :meth:`read`).
+        """
+        return self.read(lambda: struct.unpack_from(self._registers, offset))[1]
+
+    def read(self, copy):
+        """
+        Call *copy* (without arguments) to copy something out of the
+        registers, retrying until no write overlapped the copy. Returns a
+        tuple of the sequence number of the copied registers and the result
+        of *copy*.
+
+        If the writer died part way through a write, the registers are copied
+        as they are (with a warning). If a live writer prevents a consistent
+        copy for more than :attr:`timeout` seconds, :exc:`IOError` is raised.
+        """
+        deadline = None
+        while True:
+            for attempt in range(self.retries):
+                sequence = SEQUENCE.unpack_from(self._map, self._offset)[0]
+                if not sequence & 1:
+                    result = copy()
+                    if SEQUENCE.unpack_from(self._map, self._offset)[0] == sequence:
+                        return sequence, result
+                # Give the writer a chance to finish
+                sleep(0)
+            if self._alive is None or not self._alive():
+                warnings.warn(Warning(
+                    'Writer of the emulated registers died during an update; '
+                    'reading them as they are'))
+                return self.sequence, copy()
+            if deadline is None:
+                deadline = monotonic() + self.timeout
+            elif monotonic() > deadline:
+                raise IOError(
+                    'Timed out waiting for the writer of the emulated registers')
+            # The writer is alive, but may not be getting much CPU time (e.g.
+            # on a heavily loaded Pi); back off a little before trying again
+            sleep(0.001)
+
+
 def clamp(value, min_value, max_value):
     """
     Return *value* clipped to the range *min_value* to *max_value* inclusive.
@@ -80,3 +379,58 @@ def slow_pi():
         if e.errno == errno.ENOENT:
             return False
         raise
+
+
+# The environment variable naming the emulator instance to use by default;
+# each instance has its own shared segment, sockets and lock so several can
+# run on one host. Names are restricted so they can be embedded in filenames
+# (and the GUI's application ID), and parsed back out of them; the pattern
+# ends with \Z as $ would also match before a trailing newline
+INSTANCE_ENV = 'SENSE_EMU_INSTANCE'
+INSTANCE_NAME = re.compile(r'^[A-Za-z0-9_]*\Z')
+
+
+def instance_name(instance=None):
+    """
+    Return the name of the emulator instance to use: *instance* if it isn't
+    ``None``, or the value of the ``SENSE_EMU_INSTANCE`` environment variable
+    otherwise. The default instance is named ``''``.
+    """
+    if instance is None:
+        instance = os.environ.get(INSTANCE_ENV, '')
+    if not INSTANCE_NAME.match(instance):
+        raise ValueError(
+            'invalid instance name %r (only letters, digits and underscores '
+            'are permitted)' % instance)
+    return instance
+
+
+def shared_dir():
+    """
+    Return the directory holding the files and sockets shared by the
+    processes using the emulator. On UNIX we try ``/dev/shm`` then fall back
+    to ``/tmp``; on Windows we use whatever ``%TEMP%`` contains.
+    """
+    if sys.platform.startswith('win'):
+        # just use a temporary file on Windows
+        return os.environ['TEMP']
+    else:
+        if os.path.exists('/dev/shm'):
+            return '/dev/shm'
+        else:
+            return '/tmp'
+
+
+def shared_filename(suffix='', instance=None):
+    """
+    Return the name of the shared file (or socket) with the specified
+    *suffix* belonging to the emulator *instance* (see :func:`instance_name`).
+    The files of the default instance are named ``rpi-sense-emu<suffix>``,
+    and those of instance *foo* ``rpi-sense-emu@foo<suffix>``.
+    """
+    instance = instance_name(instance)
+    if instance:
+        fname = 'rpi-sense-emu@%s%s' % (instance, suffix)
+    else:
+        fname = 'rpi-sense-emu%s' % suffix
+    return os.path.join(shared_dir(), fname)
@@ -26,9 +26,16 @@ import errno
 import shlex
 import subprocess
 import webbrowser
+import logging
 import datetime as dt
-from time import time, sleep
+from time import time, sleep, monotonic
+from functools import lru_cache
 from threading import Thread, Lock, Event
+from concurrent.futures import ThreadPoolExecutor
+
+# Start-up times are logged relative to this, which is taken before the
+# (relatively slow) imports of GTK and NumPy below
+STARTED = monotonic()
 
 import gi
 gi.require_version('cairo', '1.0')
@@ -42,12 +49,14 @@ import pkg_resources
 from . import __project__, __version__, __author__, __author_email__, __url__
 from .i18n import init_i18n, _
 from .screen import ScreenClient
+from .render import BoardRenderer, BOARD_WIDTH, BOARD_HEIGHT
 from .imu import IMUServer
 from .pressure import PressureServer
 from .humidity import HumidityServer
 from .stick import StickServer, SenseStick
 from .lock import EmulatorLock
-from .common import HEADER_REC, DATA_REC, DataRecord, slow_pi
+from .segment import open_segment
+from .common import Recording, clamp, slow_pi, instance_name
 
 
 def main():
@@ -56,6 +65,11 @@ def main():
     app.run(sys.argv)
 
 
+def log_startup(event):
+    logging.info('%6.1fms: %s', (monotonic() - STARTED) * 1000, event)
+
+
+@lru_cache()
 def load_image(filename, format='png'):
     loader = GdkPixbuf.PixbufLoader.new_with_type(format)
     loader.write(pkg_resources.resource_string(__name__, filename))
@@ -63,18 +77,55 @@ def load_image(filename, format='png'):
     return loader.get_pixbuf()
 
 
+def pixbuf_from_array(image):
+    """
+    Return a new Pixbuf containing a copy of the (height, width, 4) array of
+    RGBA values *image*.
+    """
+    height, width = image.shape[:2]
+    return GdkPixbuf.Pixbuf.new_from_bytes(
+        GLib.Bytes.new(np.ascontiguousarray(image).tobytes()),
+        colorspace=GdkPixbuf.Colorspace.RGB, has_alpha=True,
+        bits_per_sample=8, width=width, height=height, rowstride=width * 4)
+
+
 def load_ui(filename):
     return pkg_resources.resource_string(__name__, filename)
 
 
 class EmuApplication(Gtk.Application):
+    settings_id = 'org.raspberrypi.sense_emu_gui'
+
     def __init__(self, *args, **kwargs):
+        # Each emulator instance (selected by SENSE_EMU_INSTANCE) is a separate
+        # application, otherwise starting the emulator of one instance would
+        # just activate that of another
+        self.instance = instance_name()
+        application_id = self.settings_id
+        if self.instance:
+            application_id += '.instance_' + self.instance
         super(EmuApplication, self).__init__(
-                *args, application_id='org.raspberrypi.sense_emu_gui',
+                *args, application_id=application_id,
                 flags=Gio.ApplicationFlags.HANDLES_COMMAND_LINE,
                 **kwargs)
-        GLib.set_application_name(_('Sense HAT Emulator'))
+        if self.instance:
+            GLib.set_application_name(
+                _('Sense HAT Emulator (%s)') % self.instance)
+        else:
+            GLib.set_application_name(_('Sense HAT Emulator'))
+        self.add_main_option(
+            'verbose', ord('v'), GLib.OptionFlags.NONE, GLib.OptionArg.NONE,
+            _('Log start-up timings and other diagnostic messages'), None)
         self.window = None
+        self.prefs_dialog = None
+        self.examples_menu = None
+
+    def do_handle_local_options(self, options):
+        if options.contains('verbose'):
+            logging.basicConfig(level=logging.INFO, format='%(message)s')
+        log_startup('imported modules')
+        # -1 means continue with the default processing
+        return -1
 
     def do_startup(self):
         # super-call needs to be in this form?!
@@ -99,6 +150,37 @@ class EmuApplication(Gtk.Application):
                 self.quit()
                 return
 
+        log_startup('acquired lock')
+
+        # Construct the settings database and tweak initial value of
+        # simulate-imu and simulate-env if we're running on a slow Pi, and the
+        # user hasn't explicitly set a value yet
+        if pkg_resources.resource_exists(__name__, 'gschemas.compiled'):
+            source = Gio.SettingsSchemaSource.new_from_directory(
+                os.path.dirname(pkg_resources.resource_filename(__name__, 'gschemas.compiled')),
+                Gio.SettingsSchemaSource.get_default(), True)
+        else:
+            source = Gio.SettingsSchemaSource.get_default()
+        schema = Gio.SettingsSchemaSource.lookup(
+            source, self.settings_id, False)
+        assert schema is not None
+        self.settings = Gio.Settings.new_full(schema, None, None)
+        if self.settings.get_user_value('simulate-imu') is None:
+            enable_simulators = not slow_pi()
+            self.settings.set_boolean('simulate-imu', enable_simulators)
+            self.settings.set_boolean('simulate-env', enable_simulators)
+
+        # Construct the emulator servers
+        self.imu = IMUServer(simulate_world=self.settings.get_boolean('simulate-imu'))
+        self.pressure = PressureServer(simulate_noise=self.settings.get_boolean('simulate-env'))
+        self.humidity = HumidityServer(simulate_noise=self.settings.get_boolean('simulate-env'))
+        # The screen widget polls the screen's sequence number on every frame
+        # clock tick, so it needn't be notified of (and slow) every commit
+        self.screen = ScreenClient(notify=False)
+        self.stick = StickServer()
+        open_segment().start_writer()
+        log_startup('started servers')
+
         def make_action(action_id, handler, param_type=None):
             action = Gio.SimpleAction.new(action_id, param_type)
             action.connect('activate', handler)
@@ -114,8 +196,16 @@ class EmuApplication(Gtk.Application):
         builder.add_from_string(
             pkg_resources.resource_string(__name__, 'menu.ui').decode('utf-8'))
         self.set_menubar(builder.get_object('app-menu'))
+        # The examples sub-menu is filled in once the window is shown (see
+        # build_examples_menu)
+        self.examples_menu = builder.get_object('example-submenu')
+
+        # Connect the settings to the components
+        self.settings.connect('changed', self.settings_changed)
 
-        # Construct the open examples sub-menu
+    def build_examples_menu(self):
+        # Walking the examples is relatively slow, so this is deferred until
+        # the main window has been shown
         for directory, label in [
                 # I18N: Easy examples
                 ('basic',        _('Simple')),
@@ -137,42 +227,25 @@ class EmuApplication(Gtk.Application):
                             GLib.Variant.new_string(
                                 '{directory}/{example}'.format(
                                     directory=directory, example=example))))
-            builder.get_object('example-submenu').append_submenu(label, examples)
-
-        # Construct the settings database and tweak initial value of
-        # simulate-imu and simulate-env if we're running on a slow Pi, and the
-        # user hasn't explicitly set a value yet
-        if pkg_resources.resource_exists(__name__, 'gschemas.compiled'):
-            source = Gio.SettingsSchemaSource.new_from_directory(
-                os.path.dirname(pkg_resources.resource_filename(__name__, 'gschemas.compiled')),
-                Gio.SettingsSchemaSource.get_default(), True)
-        else:
-            source = Gio.SettingsSchemaSource.get_default()
-        schema = Gio.SettingsSchemaSource.lookup(
-            source, self.props.application_id, False)
-        assert schema is not None
-        self.settings = Gio.Settings.new_full(schema, None, None)
-        if self.settings.get_user_value('simulate-imu') is None:
-            enable_simulators = not slow_pi()
-            self.settings.set_boolean('simulate-imu', enable_simulators)
-            self.settings.set_boolean('simulate-env', enable_simulators)
-
-        # Construct the emulator servers
-        self.imu = IMUServer(simulate_world=self.settings.get_boolean('simulate-imu'))
-        self.pressure = PressureServer(simulate_noise=self.settings.get_boolean('simulate-env'))
-        self.humidity = HumidityServer(simulate_noise=self.settings.get_boolean('simulate-env'))
-        self.screen = ScreenClient()
-        self.stick = StickServer()
-
-        # Connect the settings to the components
-        self.settings.connect('changed', self.settings_changed)
+            self.examples_menu.append_submenu(label, examples)
+        log_startup('built examples menu')
+        return False
 
-    def settings_changed(self, settings, key):
+    def simulation_changed(self, settings, key):
         if key == 'simulate-env':
             self.pressure.simulate_noise = settings.get_boolean(key)
             self.humidity.simulate_noise = settings.get_boolean(key)
         elif key == 'simulate-imu':
             self.imu.simulate_world = settings.get_boolean(key)
+
+    def settings_changed(self, settings, key):
+        if key in ('simulate-env', 'simulate-imu'):
+            # Switching simulation writes the sensors' registers, which the
+            # window's updater may be doing at the same time
+            if self.window:
+                self.window.updater.call(self.simulation_changed, settings, key)
+            else:
+                self.simulation_changed(settings, key)
         elif key == 'orientation-scale':
             # Force the orientation sliders to redraw
             self.window.yaw_scale.queue_draw()
@@ -183,7 +256,11 @@ class EmuApplication(Gtk.Application):
 
     def do_shutdown(self):
         if self.lock.mine:
+            open_segment().stop_writer()
             self.lock.release()
+            if self.prefs_dialog:
+                self.prefs_dialog.destroy()
+                self.prefs_dialog = None
             if self.window:
                 self.window.destroy()
                 self.window = None
@@ -207,6 +284,9 @@ class EmuApplication(Gtk.Application):
                 )
             if self.settings.get_boolean('window-maximized'):
                 self.window.maximize()
+            log_startup('constructed window')
+            GLib.idle_add(
+                self.build_examples_menu, priority=GLib.PRIORITY_LOW)
         if self.window:
             self.window.present()
 
@@ -278,19 +358,100 @@ class EmuApplication(Gtk.Application):
             open_dialog.destroy()
 
     def on_prefs(self, action, param):
-        prefs_dialog = PrefsDialog(
-            transient_for=self.window,
-            title=_('Preferences'),
-            settings=self.settings)
+        # The dialog is constructed on first use, and hidden (rather than
+        # destroyed) afterward so that it's only built once
+        if self.prefs_dialog is None:
+            self.prefs_dialog = PrefsDialog(
+                transient_for=self.window,
+                title=_('Preferences'),
+                settings=self.settings)
         try:
-            prefs_dialog.run()
+            self.prefs_dialog.run()
         finally:
-            prefs_dialog.destroy()
+            self.prefs_dialog.hide()
 
     def on_quit(self, action, param):
         self.quit()
 
 
+class ServerUpdater:
+    """
+    Calls the setters of the sensor servers from a background thread, at most
+    once per *interval* of each server. When updates are requested faster
+    than that (e.g. by dragging a slider), only the latest is applied.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        # Held while calling methods, so that cancel and call can wait for
+        # any call in progress
+        self._calling = Lock()
+        self._pending = {}
+        self._next = {}
+        self._event = Event()
+        self._stop = False
+        self._thread = Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self):
+        if self._thread:
+            self._stop = True
+            self._event.set()
+            self._thread.join()
+            self._thread = None
+
+    def update(self, interval, method, *args):
+        """
+        Request a call to *method* with *args*, replacing any call to *method*
+        that's still pending; *method* will not be called more than once per
+        *interval* seconds.
+        """
+        with self._lock:
+            self._pending[method] = (interval, args)
+        self._event.set()
+
+    def cancel(self):
+        """
+        Discard all pending calls, and wait for any call in progress to
+        finish.
+        """
+        with self._lock:
+            self._pending.clear()
+        with self._calling:
+            pass
+
+    def call(self, method, *args):
+        """
+        Call *method* with *args* immediately (in the calling thread), after
+        waiting for any call in progress to finish. This is for changes to the
+        sensor servers that mustn't overlap the updates.
+        """
+        with self._calling:
+            return method(*args)
+
+    def _run(self):
+        while not self._stop:
+            with self._lock:
+                self._event.clear()
+                now = monotonic()
+                due = [
+                    (method, args)
+                    for method, (interval, args) in self._pending.items()
+                    if self._next.get(method, now) <= now
+                ]
+                for method, args in due:
+                    interval, args = self._pending.pop(method)
+                    self._next[method] = now + interval
+                timeout = min((
+                    self._next[method] - now
+                    for method in self._pending
+                ), default=None)
+            with self._calling:
+                for method, args in due:
+                    method(*args)
+            self._event.wait(timeout)
+
+
 class ScreenWidget(Gtk.DrawingArea):
     __gtype_name__ = 'ScreenWidget'
 
@@ -299,79 +460,162 @@ class ScreenWidget(Gtk.DrawingArea):
         self.set_has_window(True)
         self.set_size_request(265, 265)
 
-        # Load graphics assets
-        self._board_full = load_image('sense_emu.png')
-        self._board_scaled = self._board_full
-        self._orient_full = load_image('orientation.png')
-        self._orient_image = self._orient_full
-        self._grid_full = load_image('pixel_grid.png')
-        self._grid_scaled = self._grid_full
-
-        # Set up a thread to constantly refresh the pixels from the screen
-        # client object
+        # The screen is refreshed from the screen client object by a tick
+        # callback on the frame clock, at most once every screen_update_delay
+        # seconds
         self.screen_update_delay = 0.04
-        self._size_lock = Lock()
-        self._ratio = 1.0
+        self._ratio = None
         self._rotation = 0
         self._show_orientation = False
-        self._draw_pending = Event()
+        # The board (with the grid and orientation overlay composited) is
+        # rendered to _board_image once per size, rotation, or orientation
+        # change; each frame only renders the LED matrix, to _draw_image,
+        # which is drawn over the board at _draw_rect
+        self._renderer = None
+        self._renderer_params = None
+        self._board_image = None
+        self._drawn = False
+        # Scaling the board's assets is slow, so new renderers are
+        # constructed by a worker, and the current one continues to be used
+        # until it's ready. _wanted holds the parameters of the renderer most
+        # recently requested. The worker only exists while the widget is
+        # realized (which it may be several times, e.g. when reparented)
+        self._scaler = None
+        self._wanted = None
         self._draw_image = None
-        self._draw_timestamp = 0.0
-        self._stop = Event()
-        self._update_thread = Thread(target=self._update_run)
-        self._update_thread.daemon = True
+        self._draw_rect = None
+        self._draw_sequence = None
+        self._draw_deadline = None
+        self._pixels = np.zeros((8, 8, 3), dtype=np.uint8)
+        self._tick_id = None
         self.connect('realize', self.realized)
+        self.connect('unrealize', self.unrealized)
         self.connect('size-allocate', self.resized)
         self.connect('draw', self.drawn)
 
     def realized(self, widget):
-        self._update_thread.start()
+        self._tick_id = self.add_tick_callback(self.ticked)
+        self._scaler = ThreadPoolExecutor(max_workers=1)
+        if self._wanted is not None and self._wanted != self._renderer_params:
+            # A renderer was requested while we were unrealized
+            self._submit_scale()
+
+    def unrealized(self, widget):
+        if self._tick_id is not None:
+            self.remove_tick_callback(self._tick_id)
+            self._tick_id = None
+        self._scaler.shutdown(wait=False)
+        self._scaler = None
 
     def resized(self, widget, rect):
-        with self._size_lock:
-            if self._rotation in (0, 180):
-                ratio = min(
-                    rect.width / self._board_full.props.width,
-                    rect.height / self._board_full.props.height)
-            else:
-                ratio = min(
-                    rect.width / self._board_full.props.height,
-                    rect.height / self._board_full.props.width)
-            ratio = min(ratio, 1.0) # never resize larger than native
-            if ratio != self._ratio:
-                # Only resize if necessary (plenty of resizes wind up with the
-                # same ratio)
-                self._board_scaled = self._board_full.scale_simple(
-                    self._board_full.props.width * ratio,
-                    self._board_full.props.height * ratio,
-                    GdkPixbuf.InterpType.BILINEAR)
-                self._grid_scaled = self._grid_full.scale_simple(
-                    self._grid_full.props.width * ratio,
-                    self._grid_full.props.height * ratio,
-                    GdkPixbuf.InterpType.BILINEAR)
-                self._orient_scaled = self._orient_full.scale_simple(
-                    self._orient_full.props.width * ratio,
-                    self._orient_full.props.height * ratio,
-                    GdkPixbuf.InterpType.BILINEAR)
-                self._ratio = ratio
+        if self._rotation in (0, 180):
+            ratio = min(rect.width / BOARD_WIDTH, rect.height / BOARD_HEIGHT)
+        else:
+            ratio = min(rect.width / BOARD_HEIGHT, rect.height / BOARD_WIDTH)
+        ratio = min(ratio, 1.0) # never resize larger than native
+        # Round the ratio down to a multiple of 0.5% so that resizing the
+        # window mostly re-uses scaled assets from the renderer's cache
+        ratio = max(1, math.floor(ratio * 200)) / 200
+        if ratio != self._ratio:
+            # Only resize if necessary (plenty of resizes wind up with the
+            # same ratio)
+            self._ratio = ratio
+            self._update_renderer()
+
+    def _update_renderer(self):
+        self._wanted = (self._ratio, self._rotation, self._show_orientation)
+        if self._scaler is not None:
+            self._submit_scale()
+
+    def _submit_scale(self):
+        future = self._scaler.submit(self._scale, self._wanted)
+        future.add_done_callback(self._scale_done)
+
+    def _scale_done(self, future):
+        # This runs in the _scaler's worker thread (or the main thread if the
+        # future was cancelled); report failures from the main loop
+        if not future.cancelled() and future.exception() is not None:
+            GLib.idle_add(self._scale_failed, future.exception())
+
+    def _scale_failed(self, exc):
+        logging.error(
+            'Failed to scale the board', exc_info=(type(exc), exc, exc.__traceback__))
+        return False
+
+    def _scale(self, wanted):
+        # This method runs in the _scaler's worker thread; skip requests which
+        # have been superseded while they were queued
+        if wanted == self._wanted:
+            renderer = BoardRenderer(*wanted)
+            board = pixbuf_from_array(renderer.render(self._pixels))
+            GLib.idle_add(self._scaled, wanted, renderer, board)
+
+    def _scaled(self, wanted, renderer, board):
+        if wanted == self._wanted:
+            self._renderer = renderer
+            self._renderer_params = wanted
+            self._board_image = board
+            self._draw_image = None
+            self._force_update()
+        return False
+
+    def _board_offset(self):
+        # The board is centered in the widget
+        rect = self.get_allocation()
+        return (
+            (rect.width - self._board_image.props.width) // 2,
+            (rect.height - self._board_image.props.height) // 2)
 
     def drawn(self, widget, cr):
-        if self._draw_image is None:
+        if self._board_image is None:
             return
-        with self._size_lock:
-            img = self._draw_image
-            if self._show_orientation:
-                img = img.copy()
-                self._orient_scaled.composite(
-                    img, 0, 0, img.props.width, img.props.height, 0, 0, 1, 1,
-                    GdkPixbuf.InterpType.NEAREST, 215)
-        img = img.rotate_simple(self._rotation)
-        rect = self.get_allocation()
-        Gdk.cairo_set_source_pixbuf(cr, img,
-            (rect.width - img.props.width) // 2,
-            (rect.height - img.props.height) // 2)
+        # Cairo clips drawing to the invalidated region, so painting the
+        # board is cheap when only the LEDs were invalidated
+        x, y = self._board_offset()
+        Gdk.cairo_set_source_pixbuf(cr, self._board_image, x, y)
         cr.paint()
-        self._draw_pending.clear()
+        if self._draw_image is not None:
+            Gdk.cairo_set_source_pixbuf(
+                cr, self._draw_image,
+                x + self._draw_rect[0], y + self._draw_rect[1])
+            cr.paint()
+        if not self._drawn:
+            self._drawn = True
+            log_startup('drew board')
+
+    def ticked(self, widget, frame_clock):
+        # Called by the frame clock before each frame is painted; checking the
+        # screen's sequence number is cheap enough to do every frame, and the
+        # LEDs are only rendered when it has changed (and the maximum update
+        # rate permits)
+        now = frame_clock.get_frame_time() / 1000000
+        if self._draw_deadline is None or now >= self._draw_deadline:
+            seq = self._screen_client.sequence
+            if seq != self._draw_sequence and self._renderer is not None:
+                renderer = self._renderer
+                self._screen_client.get_rgb_array(self._pixels)
+                self._draw_image = pixbuf_from_array(np.rot90(
+                    renderer.render_leds(self._pixels),
+                    renderer.rotation // 90))
+                self._draw_rect = renderer.led_rect
+                self._draw_sequence = seq
+                # Schedule the next permitted update from the last deadline
+                # rather than now (unless we're well past it) so the average
+                # rate matches screen_update_delay, despite frames being
+                # quantized to the display's refresh rate
+                if (
+                        self._draw_deadline is None or
+                        now - self._draw_deadline >= self.screen_update_delay):
+                    self._draw_deadline = now
+                self._draw_deadline += self.screen_update_delay
+                x, y = self._board_offset()
+                rect = Gdk.Rectangle()
+                rect.x = x + self._draw_rect[0]
+                rect.y = y + self._draw_rect[1]
+                rect.width = self._draw_rect[2]
+                rect.height = self._draw_rect[3]
+                self.props.window.invalidate_rect(rect, False)
+        return GLib.SOURCE_CONTINUE
 
     @GObject.Property(type=object)
     def client(self):
@@ -388,8 +632,8 @@ class ScreenWidget(Gtk.DrawingArea):
     @rotation.setter
     def rotation(self, value):
         self._rotation = value
+        self._ratio = None
         self.resized(self, self.get_allocation())
-        self._force_update()
 
     @GObject.Property(type=bool, default=False)
     def orientation(self):
@@ -398,78 +642,15 @@ class ScreenWidget(Gtk.DrawingArea):
     @orientation.setter
     def orientation(self, value):
         self._show_orientation = value
-        self._force_update()
+        if self._ratio is not None:
+            self._update_renderer()
 
     def _force_update(self):
-        self._draw_pending.clear()
-        self._draw_timestamp = 0
-        # Wait for the background thread to update the pixels image (this
-        # should never take more than a second)
-        self._draw_pending.wait(1)
-        self.props.window.invalidate_rect(None, False)
-
-    def _update_run(self):
-        # This method runs in the background _update_thread
-        while True:
-            # Only update the screen if do_draw's finished the last update;
-            # this effectively serves to "drop frames" if the system's too
-            # busy
-            if self._draw_pending.wait(self.screen_update_delay):
-                # The wait period above enforces the maximum update rate; if
-                # a draw is still pending, wait on the stop event instead
-                if self._stop.wait(self.screen_update_delay):
-                    break
-            else:
-                # Only update if the screen's modification timestamp indicates
-                # that the data has changed since last time
-                ts = self._screen_client.timestamp
-                if ts > self._draw_timestamp:
-                    with self._size_lock:
-                        img = self._board_scaled.copy()
-                        pixels = GdkPixbuf.Pixbuf.new_from_bytes(
-                            GLib.Bytes.new(self._screen_client.rgb_array.tostring()),
-                            colorspace=GdkPixbuf.Colorspace.RGB, has_alpha=False,
-                            bits_per_sample=8, width=8, height=8, rowstride=8 * 3)
-                        pixel_rect = Gdk.Rectangle()
-                        pixel_rect.x = int(126 * self._ratio)
-                        pixel_rect.y = int(155 * self._ratio)
-                        pixel_rect.width = int(512 * self._ratio)
-                        pixel_rect.height = pixel_rect.width
-                        pixels.composite(
-                            img,
-                            pixel_rect.x, pixel_rect.y,
-                            pixel_rect.width, pixel_rect.height,
-                            pixel_rect.x, pixel_rect.y,
-                            # Why 8.1? With 8.0 (which is what it should be),
-                            # registration errors crop up at the far right (try
-                            # it and see); no idea why 8.1 is required to
-                            # correct them, but I'm too knackered to argue with
-                            # Gdk any more...
-                            pixel_rect.width / 8.1, pixel_rect.height / 8.1,
-                            GdkPixbuf.InterpType.NEAREST, 255)
-                        self._grid_scaled.composite(
-                            img,
-                            pixel_rect.x, pixel_rect.y,
-                            pixel_rect.width, pixel_rect.height,
-                            pixel_rect.x, pixel_rect.y,
-                            1, 1,
-                            GdkPixbuf.InterpType.NEAREST, 255)
-                    self._draw_image = img
-                    self._draw_timestamp = ts
-                    self._draw_pending.set()
-                    # Schedule a redraw when the app is next idle; like Gtk
-                    # methods, Gdk methods must only be called from the main
-                    # thread (otherwise the app locks up)
-                    try:
-                        GLib.idle_add(self.props.window.invalidate_rect, None, False)
-                    except AttributeError:
-                        # Our Gdk window has been destroyed; don't whinge, just
-                        # exit the thread as we're obviously shutting down
-                        break
-
-    def do_destroy(self):
-        self._stop.set()
-        self._update_thread.join()
+        # Redraw everything, and have the next tick render the LEDs regardless
+        # of whether the screen has changed
+        self._draw_sequence = None
+        self._draw_deadline = None
+        self.queue_draw()
 
 
 @Gtk.Template(string=load_ui('main_window.ui'))
@@ -504,7 +685,10 @@ class MainWindow(Gtk.ApplicationWindow):
 
     play_box = Gtk.Template.Child()
     play_label = Gtk.Template.Child()
-    play_progressbar = Gtk.Template.Child()
+    play_pause_button = Gtk.Template.Child()
+    play_scale = Gtk.Template.Child()
+    play_position = Gtk.Template.Child()
+    play_speed = Gtk.Template.Child()
 
     def __init__(self, *args, **kwargs):
         super(MainWindow, self).__init__(*args, **kwargs)
@@ -513,13 +697,27 @@ class MainWindow(Gtk.ApplicationWindow):
         icon = load_image('sense_emu_gui.png')
         self.props.icon = icon
 
-        # Set up the objects for the playback thread
+        # Set up the objects for the playback thread. The playback position
+        # (in seconds from the start of the recording) is _play_base[0] at
+        # the monotonic time _play_base[1], advancing at _play_speed unless
+        # _play_paused. These, and _play_seek (a position requested by the
+        # user), are protected by _play_state_lock; _play_wake is set to wake
+        # the thread when any of them change
         self._play_update_lock = Lock()
         self._play_update_id = 0
         self._play_event = Event()
+        self._play_wake = Event()
+        self._play_state_lock = Lock()
+        self._play_base = (0.0, 0.0)
+        self._play_speed = 1.0
+        self._play_paused = False
+        self._play_seek = None
         self._play_thread = None
         self._play_restore = (True, True, True)
 
+        # Slider changes are passed to the sensor servers by the updater
+        self.updater = ServerUpdater()
+
         # Set up the custom screen widget
         self.screen_widget = ScreenWidget(visible=True, client=self.props.application.screen)
         self.screen_box.pack_start(self.screen_widget, True, True, 0)
@@ -579,6 +777,7 @@ class MainWindow(Gtk.ApplicationWindow):
     def do_destroy(self):
         try:
             self._play_stop()
+            self.updater.close()
         except AttributeError:
             # do_destroy gets called multiple times, and subsequent times lacks
             # the Python-added instance attributes
@@ -592,7 +791,9 @@ class MainWindow(Gtk.ApplicationWindow):
     @Gtk.Template.Callback()
     def pressure_changed(self, adjustment):
         if not self._play_thread:
-            self.props.application.pressure.set_values(
+            server = self.props.application.pressure
+            self.updater.update(
+                server.interval, server.set_values,
                 self.pressure.props.value,
                 self.temperature.props.value,
                 )
@@ -604,7 +805,9 @@ class MainWindow(Gtk.ApplicationWindow):
     @Gtk.Template.Callback()
     def humidity_changed(self, adjustment):
         if not self._play_thread:
-            self.props.application.humidity.set_values(
+            server = self.props.application.humidity
+            self.updater.update(
+                server.interval, server.set_values,
                 self.humidity.props.value,
                 self.temperature.props.value,
                 )
@@ -632,10 +835,12 @@ class MainWindow(Gtk.ApplicationWindow):
     @Gtk.Template.Callback()
     def orientation_changed(self, adjustment):
         if not self._play_thread:
-            self.props.application.imu.set_orientation((
-                self.roll.props.value,
-                self.pitch.props.value,
-                self.yaw.props.value,
+            server = self.props.application.imu
+            self.updater.update(
+                server.interval, server.set_orientation, (
+                    self.roll.props.value,
+                    self.pitch.props.value,
+                    self.yaw.props.value,
                 ))
 
     @Gtk.Template.Callback()
@@ -717,40 +922,43 @@ class MainWindow(Gtk.ApplicationWindow):
     def toggle_orientation(self, button):
         self.screen_widget.props.orientation = not self.screen_widget.props.orientation
 
-    def _play_run(self, f):
+    def _play_run(self, recording):
         err = None
         try:
-            # Calculate how many records are in the file; we'll use this later
-            # when updating the progress bar
-            rec_total = (f.seek(0, io.SEEK_END) - HEADER_REC.size) // DATA_REC.size
-            f.seek(0)
-            skipped = 0
-            for rec, data in enumerate(self._play_source(f)):
-                now = time()
-                if data.timestamp < now:
-                    skipped += 1
+            rec = 0
+            while not self._play_event.is_set():
+                self._play_wake.clear()
+                with self._play_state_lock:
+                    seek, self._play_seek = self._play_seek, None
+                    position = self._play_position()
+                    speed = self._play_speed
+                    paused = self._play_paused
+                if seek is not None:
+                    # Apply the record in effect at the new position straight
+                    # away so the sensors reflect it, even while paused
+                    rec = recording.index(seek)
+                    if rec > 0:
+                        self._play_apply(recording[rec - 1], seek)
+                    continue
+                if rec >= len(recording):
+                    if paused:
+                        self._play_wake.wait()
+                        continue
+                    break
+                due = recording[rec].timestamp
+                if paused or due > position:
+                    self._play_wake.wait(
+                        None if paused else (due - position) / speed)
                     continue
-                else:
-                    if self._play_event.wait(data.timestamp - now):
-                        break
-                self.props.application.pressure.set_values(data.pressure, data.ptemp)
-                self.props.application.humidity.set_values(data.humidity, data.htemp)
-                self.props.application.imu.set_imu_values(
-                    (data.ax, data.ay, data.az),
-                    (data.gx, data.gy, data.gz),
-                    (data.cx, data.cy, data.cz),
-                    (data.ox, data.oy, data.oz),
-                    )
-                # Again, would be better to use custom signals here but
-                # attempting to do so just results in seemingly random
-                # segfaults during playback
-                with self._play_update_lock:
-                    if self._play_update_id == 0:
-                        self._play_update_id = GLib.idle_add(self._play_update_controls, rec / rec_total)
+                # If we've fallen behind (or are playing very fast) skip to the
+                # last record that's due
+                rec = max(rec, recording.index(position) - 1)
+                self._play_apply(recording[rec], position)
+                rec += 1
         except Exception as e:
             err = e
         finally:
-            f.close()
+            recording.close()
             # Must ensure that controls are only re-enabled *after* all pending
             # control updates have run
             with self._play_update_lock:
@@ -761,10 +969,49 @@ class MainWindow(Gtk.ApplicationWindow):
             # playback
             GLib.idle_add(self._play_controls_finish, err)
 
-    def _play_update_controls(self, fraction):
+    def _play_position(self):
+        # Must be called with _play_state_lock held
+        position, clock = self._play_base
+        if self._play_paused:
+            return position
+        return position + (monotonic() - clock) * self._play_speed
+
+    def _play_rebase(self, position=None, speed=None, paused=None):
+        # Re-base the playback clock at the current position (or a new one)
+        # before changing the speed, or pausing, and wake the playback thread
+        # to re-evaluate when the next record is due
+        with self._play_state_lock:
+            if position is None:
+                position = self._play_position()
+            else:
+                self._play_seek = position
+            self._play_base = (position, monotonic())
+            if speed is not None:
+                self._play_speed = speed
+            if paused is not None:
+                self._play_paused = paused
+        self._play_wake.set()
+
+    def _play_apply(self, data, position):
+        self.props.application.pressure.set_values(data.pressure, data.ptemp)
+        self.props.application.humidity.set_values(data.humidity, data.htemp)
+        self.props.application.imu.set_imu_values(
+            (data.ax, data.ay, data.az),
+            (data.gx, data.gy, data.gz),
+            (data.cx, data.cy, data.cz),
+            (data.ox, data.oy, data.oz),
+            )
+        # Again, would be better to use custom signals here but
+        # attempting to do so just results in seemingly random
+        # segfaults during playback
+        with self._play_update_lock:
+            if self._play_update_id == 0:
+                self._play_update_id = GLib.idle_add(self._play_update_controls, position)
+
+    def _play_update_controls(self, position):
         with self._play_update_lock:
             self._play_update_id = 0
-        self.play_progressbar.props.fraction = fraction
+        self.play_position.props.value = position
         if not math.isnan(self.props.application.humidity.temperature):
             self.temperature.props.value = self.props.application.humidity.temperature
         if not math.isnan(self.props.application.pressure.pressure):
@@ -780,35 +1027,50 @@ class MainWindow(Gtk.ApplicationWindow):
     def play_stop_clicked(self, button):
         self._play_stop()
 
+    @Gtk.Template.Callback()
+    def play_pause_toggled(self, button):
+        self._play_rebase(paused=button.props.active)
+
+    @Gtk.Template.Callback()
+    def play_position_changed(self, scale, scroll, value):
+        # Only emitted when the user moves the slider (not when playback
+        # updates it)
+        value = clamp(value, 0, self.play_position.props.upper)
+        self._play_rebase(position=value)
+        return False
+
+    @Gtk.Template.Callback()
+    def format_play_position(self, scale, value):
+        minutes, seconds = divmod(int(value), 60)
+        hours, minutes = divmod(minutes, 60)
+        if hours:
+            return '%d:%02d:%02d' % (hours, minutes, seconds)
+        return '%d:%02d' % (minutes, seconds)
+
+    @Gtk.Template.Callback()
+    def play_speed_changed(self, adjustment):
+        # The speed slider is logarithmic, ranging from 0.1x to 50x
+        self._play_rebase(speed=10 ** adjustment.props.value)
+
+    @Gtk.Template.Callback()
+    def format_play_speed(self, scale, value):
+        return '%.2g×' % (10 ** value)
+
     def _play_stop(self):
         if self._play_thread:
             self._play_event.set()
+            self._play_wake.set()
             self._play_thread.join()
             self._play_thread = None
 
-    def _play_source(self, f):
-        magic, ver, offset = HEADER_REC.unpack(f.read(HEADER_REC.size))
-        if magic != b'SENSEHAT':
-            raise IOError(_('%s is not a Sense HAT recording') % f.name)
-        if ver != 1:
-            raise IOError(_('%s has unrecognized file version number') % f.name)
-        offset = time() - offset
-        while True:
-            buf = f.read(DATA_REC.size)
-            if not buf:
-                break
-            elif len(buf) < DATA_REC.size:
-                raise IOError(_('Incomplete data record at end of %s') % f.name)
-            else:
-                data = DataRecord(*DATA_REC.unpack(buf))
-                yield data._replace(timestamp=data.timestamp + offset)
-
-    def _play_controls_setup(self, filename):
+    def _play_controls_setup(self, recording):
         # Disable all the associated user controls while playing back
         self.environ_box.props.sensitive = False
         self.gyro_grid.props.sensitive = False
-        # Disable simulation threads as we're going to manipulate the
-        # values precisely
+        # Discard any slider changes that haven't been applied yet, and
+        # disable simulation threads as we're going to manipulate the values
+        # precisely
+        self.updater.cancel()
         self._play_restore = (
             self.props.application.pressure.simulate_noise,
             self.props.application.humidity.simulate_noise,
@@ -817,9 +1079,15 @@ class MainWindow(Gtk.ApplicationWindow):
         self.props.application.pressure.simulate_noise = False
         self.props.application.humidity.simulate_noise = False
         self.props.application.imu.simulate_world = False
-        # Show the playback bar
-        self.play_label.props.label = _('Playing %s') % os.path.basename(filename)
-        self.play_progressbar.props.fraction = 0.0
+        # Reset the playback clock, and show the playback bar
+        self._play_base = (0.0, monotonic())
+        self._play_paused = False
+        self._play_seek = None
+        self._play_speed = 10 ** self.play_speed.props.value
+        self.play_label.props.label = _('Playing %s') % os.path.basename(recording.name)
+        self.play_position.props.upper = recording.duration
+        self.play_position.props.value = 0.0
+        self.play_pause_button.props.active = False
         self.play_box.props.visible = True
 
     def _play_controls_finish(self, exc):
@@ -835,21 +1103,30 @@ class MainWindow(Gtk.ApplicationWindow):
         # If an exception occurred in the background thread, display the
         # error in an appropriate dialog
         if exc:
-            dialog = Gtk.MessageDialog(
-                transient_for=self,
-                message_type=Gtk.MessageType.ERROR,
-                title=_('Error'),
-                text=_('Error while replaying recording'),
-                buttons=Gtk.ButtonsType.CLOSE)
-            dialog.format_secondary_text(str(exc))
-            dialog.run()
-            dialog.destroy()
+            self._play_error(exc)
+
+    def _play_error(self, exc):
+        dialog = Gtk.MessageDialog(
+            transient_for=self,
+            message_type=Gtk.MessageType.ERROR,
+            title=_('Error'),
+            text=_('Error while replaying recording'),
+            buttons=Gtk.ButtonsType.CLOSE)
+        dialog.format_secondary_text(str(exc))
+        dialog.run()
+        dialog.destroy()
 
     def play(self, filename):
         self._play_stop()
-        self._play_controls_setup(filename)
-        self._play_thread = Thread(target=self._play_run, args=(io.open(filename, 'rb'),))
+        try:
+            recording = Recording(filename)
+        except IOError as e:
+            self._play_error(e)
+            return
+        self._play_controls_setup(recording)
+        self._play_thread = Thread(target=self._play_run, args=(recording,))
         self._play_event.clear()
+        self._play_wake.clear()
         self._play_thread.start()
 
 
@@ -16,21 +16,17 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>
 
-import sys
-import os
-import io
-import mmap
 import time
-import errno
 import subprocess
-from random import Random
+from math import radians, sin, cos
 from struct import Struct
 from collections import namedtuple
-from threading import Thread, Event
 
 import numpy as np
 
-from .common import clamp
+from .common import clamp, GaussianNoise, MovingAverage
+from .scheduler import scheduler
+from .segment import open_segment
 
 
 # See LSM9DS1 data-sheet for details of register values
@@ -49,49 +45,23 @@ IMU_DATA = Struct(
     'hhh' # Orientation X, Y, Z
 )
 
-IMUData = namedtuple('IMUData', (
-    'type', 'name', 'timestamp', 'accel', 'gyro', 'compass', 'orient'))
-
-
-def imu_filename():
-    """
-    Return the filename used to represent the state of the emulated sense HAT's
-    IMU sensors. On UNIX we try ``/dev/shm`` then fall back to ``/tmp``; on
-    Windows we use whatever ``%TEMP%`` contains.
-    """
-    fname = 'rpi-sense-emu-imu'
-    if sys.platform.startswith('win'):
-        # just use a temporary file on Windows
-        return os.path.join(os.environ['TEMP'], fname)
-    else:
-        if os.path.exists('/dev/shm'):
-            return os.path.join('/dev/shm', fname)
-        else:
-            return os.path.join('/tmp', fname)
-
+# The fields of IMU_DATA written by every update of the world (everything
+# following the sensor's type and name), packed in place
+IMU_WORLD = Struct(
+    '@'   # native mode
+    'Q'   # timestamp
+    'hhh' # OUT_X_G, OUT_Y_G, OUT_Z_G
+    'hhh' # OUT_X_XL, OUT_Y_XL, OUT_Z_XL
+    'hhh' # OUT_X_M, OUT_Y_M, OUT_Z_M
+    'hhh' # Orientation X, Y, Z
+)
+IMU_WORLD_OFFSET = IMU_DATA.size - IMU_WORLD.size
 
-def init_imu():
-    """
-    Opens the file representing the state of the IMU sensors. The file-like
-    object is returned.
+# The size of the sensor's registers in the shared segment
+IMU_SIZE = IMU_DATA.size
 
-    If the file already exists we simply make sure it is the right size. If
-    the file does not already exist, it is created and zeroed.
-    """
-    try:
-        # Attempt to open the IMU's device file and ensure it's the right size
-        fd = io.open(imu_filename(), 'r+b', buffering=0)
-        fd.seek(IMU_DATA.size)
-        fd.truncate()
-    except IOError as e:
-        # If the IMU device's file doesn't exist, create it with reasonable
-        # initial values
-        if e.errno == errno.ENOENT:
-            fd = io.open(imu_filename(), 'w+b', buffering=0)
-            fd.write(b'\x00' * IMU_DATA.size)
-        else:
-            raise
-    return fd
+IMUData = namedtuple('IMUData', (
+    'type', 'name', 'timestamp', 'accel', 'gyro', 'compass', 'orient'))
 
 
 # Find the best available time-source for the timestamp() function. The best
@@ -118,45 +88,53 @@ Z = V(0, 0, 1)
 
 
 class IMUServer:
-    def __init__(self, simulate_world=True):
-        self._random = Random()
-        self._fd = init_imu()
-        self._map = mmap.mmap(self._fd.fileno(), 0, access=mmap.ACCESS_WRITE)
+    # The interval (in seconds) at which the simulated world is updated; the
+    # LSM9DS1's accelerometer and gyro output data rate closest to the
+    # screen's refresh rate is 59.5Hz
+    interval = 1 / 59.5
+
+    def __init__(self, simulate_world=True, seed=None, instance=None):
+        self._noise = GaussianNoise(seed)
+        self._seqlock = open_segment(instance).seqlock('imu')
         data = self._read()
-        self._gravity = Z
-        self._north = 0.33 * X
+        # The world state is held in tuples of floats; each update of the
+        # world is run many times a second, and scalar arithmetic on these
+        # is much cheaper than creating lots of small NumPy arrays
+        self._gravity = (0.0, 0.0, 1.0)
+        self._north = (0.33, 0.0, 0.0)
         if data.type != 6:
             self._write(IMUData(6, b'LSM9DS1', timestamp(), O, O, O, O))
-            self._accel = O
-            self._gyro = O
-            self._compass = O
-            self._orientation = O
-            self._position = O
+            self._accel = (0.0, 0.0, 0.0)
+            self._gyro = (0.0, 0.0, 0.0)
+            self._compass = (0.0, 0.0, 0.0)
         else:
-            self._accel = data.accel / ACCEL_FACTOR
-            self._gyro = data.gyro / GYRO_FACTOR
-            self._compass = data.compass / COMPASS_FACTOR
-            self._orientation = O # XXX calc orientation from accel and gravity
-            self._position = O # XXX calc position from compass and north
-        self._world_thread = None
-        self._world_event = Event()
-        self._world_iter = self._world_state()
+            self._accel = tuple((data.accel / ACCEL_FACTOR).tolist())
+            self._gyro = tuple((data.gyro / GYRO_FACTOR).tolist())
+            self._compass = tuple((data.compass / COMPASS_FACTOR).tolist())
+        self._orientation = (0.0, 0.0, 0.0) # XXX calc orientation from accel and gravity
+        self._position = (0.0, 0.0, 0.0) # XXX calc position from compass and north
+        # The state of the last world step, and the gravity and north vectors
+        # rotated by _rotation_orientation (which are only recalculated when
+        # the orientation changes)
+        self._world_then = timestamp()
+        self._world_orientation = self._orientation
+        self._world_gyro = (0.0, 0.0, 0.0)
+        self._rotation_orientation = None
+        self._rotated = ((0.0, 0.0, 0.0), (0.0, 0.0, 0.0))
+        self._world_job = None
         self._world_write()
         # These queue lengths were arbitrarily selected to smooth the action of
         # the orientation sliders in the GUI; they bear no particular relation
         # to the hardware
-        self._gyros = np.full((10, 3), self._gyro, dtype=float)
-        self._accels = np.full((10, 3), self._accel, dtype=float)
-        self._comps = np.full((10, 3), self._compass, dtype=float)
+        self._gyros = [MovingAverage(10, v) for v in self._gyro]
+        self._accels = [MovingAverage(10, v) for v in self._accel]
+        self._comps = [MovingAverage(10, v) for v in self._compass]
         self.simulate_world = simulate_world
 
     def close(self):
-        if self._fd:
+        if self._seqlock:
             self.simulate_world = False
-            self._map.close()
-            self._fd.close()
-            self._fd = None
-            self._map = None
+            self._seqlock = None
 
     def _read(self):
         (
@@ -165,7 +143,7 @@ class IMUServer:
             gx, gy, gz,
             cx, cy, cz,
             ox, oy, oz,
-            ) = IMU_DATA.unpack_from(self._map)
+            ) = self._seqlock.unpack_from(IMU_DATA)
         return IMUData(
             type, name, timestamp,
             V(ax, ay, az),
@@ -182,158 +160,154 @@ class IMUServer:
             value.compass[0], value.compass[1], value.compass[2],
             value.orient[0], value.orient[1], value.orient[2],
             )
-        IMU_DATA.pack_into(self._map, 0, *value)
+        self._seqlock.pack_into(IMU_DATA, 0, *value)
 
-    def _perturb(self, value, error):
+    def _perturb(self, filters, value, error):
         """
         Return *value* perturbed by +/- *error* which is derived from a
-        gaussian random generator.
+        gaussian random generator, and smoothed by the moving averages in
+        *filters*.
         """
-        # We use an internal Random() instance here to avoid a threading issue
-        # with the gaussian generator (could use locks, but an instance of
-        # Random is easier and faster)
-        return V(
-            value[0] + self._random.gauss(0, 0.2) * error,
-            value[1] + self._random.gauss(0, 0.2) * error,
-            value[2] + self._random.gauss(0, 0.2) * error,
+        gauss = self._noise.gauss
+        sigma = 0.2 * error
+        x, y, z = value
+        fx, fy, fz = filters
+        return (
+            fx.update(gauss(x, sigma)),
+            fy.update(gauss(y, sigma)),
+            fz.update(gauss(z, sigma)),
             )
 
     def set_orientation(self, orientation, position=None):
         if position is None:
-            position = O
-        self._orientation = V(*orientation)
-        self._position = V(*position)
+            position = (0.0, 0.0, 0.0)
+        self._orientation = tuple(float(v) for v in orientation)
+        self._position = tuple(float(v) for v in position)
         if not self.simulate_world:
             self._world_write()
 
     def set_imu_values(self, accel, gyro, compass, orientation, position=None):
         assert not self.simulate_world
-        self._accel = V(*accel)
-        self._gyro = V(*gyro)
-        self._compass = V(*compass)
-        self._orientation = V(*orientation)
+        self._accel = tuple(float(v) for v in accel)
+        self._gyro = tuple(float(v) for v in gyro)
+        self._compass = tuple(float(v) for v in compass)
+        self._orientation = tuple(float(v) for v in orientation)
         if position is None:
-            position = O
-        self._position = V(*position)
+            position = (0.0, 0.0, 0.0)
+        self._position = tuple(float(v) for v in position)
         self._world_write(direct=True)
 
     @property
     def accel(self):
-        return self._accel
+        return V(*self._accel)
 
     @property
     def gyro(self):
-        return self._gyro
+        return V(*self._gyro)
 
     @property
     def compass(self):
-        return self._compass
+        return V(*self._compass)
 
     @property
     def orientation(self):
-        return self._orientation
+        return V(*self._orientation)
 
     @property
     def position(self):
-        return self._position
+        return V(*self._position)
 
     @property
     def simulate_world(self):
-        return self._world_thread is not None
+        return self._world_job is not None
 
     @simulate_world.setter
     def simulate_world(self, value):
-        if value and not self._world_thread:
-            self._world_event.clear()
-            self._world_thread = Thread(target=self._world_loop)
-            self._world_thread.daemon = True
-            self._world_thread.start()
-        elif self._world_thread and not value:
-            self._world_event.set()
-            self._world_thread.join()
-            self._world_thread = None
+        if value and not self._world_job:
+            self._world_job = scheduler.add(self.interval, self._world_write)
+        elif self._world_job and not value:
+            self._world_job.cancel()
+            self._world_job = None
             self._world_write()
 
-    def _world_state(self):
+    def _rotate(self, orientation):
+        """
+        Return the gravity and north vectors rotated into the frame of the
+        HAT at *orientation* (roll, pitch, and yaw in degrees).
         """
-        An infinite generator which expects to be passed (position, orientation)
-        states by the caller and yields (timestamp, accel, gyro, compass) states
-        back. Used by either the simulation thread (if it's running), or by
+        # Construct a rotation matrix for the orientation; see
+        # https://en.wikipedia.org/wiki/Euler_angles#Rotation_matrix
+        x, y, z = orientation
+        x, y, z = radians(x), radians(y), radians(z)
+        c1, c2, c3 = cos(z), cos(y), cos(x)
+        s1, s2, s3 = sin(z), sin(y), sin(x)
+        R = (
+            (c1 * c2, c1 * s2 * s3 - c3 * s1, s1 * s3 + c1 * c3 * s2),
+            (c2 * s1, c1 * c3 + s1 * s2 * s3, c3 * s1 * s2 - c1 * s3),
+            (-s2,     c2 * s3,                c2 * c3),
+            )
+        # Multiply by the transpose for a passive rotation
+        return tuple(
+            tuple(
+                R[0][i] * v[0] + R[1][i] * v[1] + R[2][i] * v[2]
+                for i in range(3))
+            for v in (self._gravity, self._north))
+
+    def _world_step(self, now):
+        """
+        Calculate the (accel, gyro, compass) state of the world at *now*.
+        Used by either the simulation (if it's running), or by
         set_orientation (if it's not).
         """
-        then = timestamp()
-        position = self._position
         orientation = self._orientation
-        accel = gyro = compass = O
-        while True:
-            now = timestamp()
-            new_position = self._position
-            new_orientation = self._orientation
-            time_delta = (now - then) / 1000000
-            if time_delta >= 0.016:
-                # Gyro reading is simply the rate of change of the orientation
-                gyro = (new_orientation - orientation) / time_delta
-                # Construct a rotation matrix for the orientation; see
-                # https://en.wikipedia.org/wiki/Euler_angles#Rotation_matrix
-                x, y, z = np.deg2rad(new_orientation)
-                c1, c2, c3 = np.cos((z, y, x))
-                s1, s2, s3 = np.sin((z, y, x))
-                R = np.array([
-                    [c1 * c2, c1 * s2 * s3 - c3 * s1, s1 * s3 + c1 * c3 * s2],
-                    [c2 * s1, c1 * c3 + s1 * s2 * s3, c3 * s1 * s2 - c1 * s3],
-                    [-s2,     c2 * s3,                c2 * c3],
-                    ])
-                accel = R.T.dot(self._gravity) # transpose for passive rotation
-                compass = R.T.dot(self._north)
-                then = now
-                position = new_position
-                orientation = new_orientation
-            # XXX Simulate acceleration from position
-            yield now, accel, gyro, compass
-
-    def _world_loop(self):
-        while not self._world_event.wait(0.016):
-            self._world_write()
+        time_delta = (now - self._world_then) / 1000000
+        # Ignore updates much closer together than the output data rate
+        # (e.g. a scheduled update catching up), but tolerate some jitter
+        if time_delta >= self.interval / 2:
+            # Gyro reading is simply the rate of change of the orientation
+            old = self._world_orientation
+            self._world_gyro = (
+                (orientation[0] - old[0]) / time_delta,
+                (orientation[1] - old[1]) / time_delta,
+                (orientation[2] - old[2]) / time_delta,
+                )
+            if orientation != self._rotation_orientation:
+                self._rotated = self._rotate(orientation)
+                self._rotation_orientation = orientation
+            self._world_then = now
+            self._world_orientation = orientation
+        # XXX Simulate acceleration from position
+        accel, compass = self._rotated
+        return accel, self._world_gyro, compass
 
     def _world_write(self, direct=False):
-        if direct:
-            now = timestamp()
-        else:
-            now, accel, gyro, compass = next(self._world_iter)
+        now = timestamp()
+        if not direct:
+            accel, gyro, compass = self._world_step(now)
             if self.simulate_world:
-                self._gyros[1:, :] = self._gyros[:-1, :]
-                self._gyros[0, :] = self._perturb(gyro, 1.0)
-                gyro = self._gyros.mean(axis=0)
-                self._accels[1:, :] = self._accels[:-1, :]
-                self._accels[0, :] = self._perturb(accel, 0.1)
-                accel = self._accels.mean(axis=0)
-                self._comps[1:, :] = self._comps[:-1, :]
-                self._comps[0, :] = self._perturb(compass, 2.0)
-                compass = self._comps.mean(axis=0)
+                gyro = self._perturb(self._gyros, gyro, 1.0)
+                accel = self._perturb(self._accels, accel, 0.1)
+                compass = self._perturb(self._comps, compass, 2.0)
             self._gyro = gyro
             self._accel = accel
             self._compass = compass
-        orient = np.deg2rad(self._orientation)
-        self._write(self._read()._replace(
-            timestamp=now,
-            accel=V(
-                int(clamp(self._accel[0], -8, 8) * ACCEL_FACTOR),
-                int(clamp(self._accel[1], -8, 8) * ACCEL_FACTOR),
-                int(clamp(self._accel[2], -8, 8) * ACCEL_FACTOR),
-                ),
-            gyro=V(
-                int(clamp(self._gyro[0], -500, 500) * GYRO_FACTOR),
-                int(clamp(self._gyro[1], -500, 500) * GYRO_FACTOR),
-                int(clamp(self._gyro[2], -500, 500) * GYRO_FACTOR),
-                ),
-            compass=V(
-                int(clamp(self._compass[0], -4, 4) * COMPASS_FACTOR),
-                int(clamp(self._compass[1], -4, 4) * COMPASS_FACTOR),
-                int(clamp(self._compass[2], -4, 4) * COMPASS_FACTOR),
-                ),
-            orient=V(
-                int(clamp(orient[0], -180, 180) * ORIENT_FACTOR),
-                int(clamp(orient[1], -180, 180) * ORIENT_FACTOR),
-                int(clamp(orient[2], -180, 180) * ORIENT_FACTOR),
-                )
-            ))
+        ax, ay, az = self._accel
+        gx, gy, gz = self._gyro
+        cx, cy, cz = self._compass
+        ox, oy, oz = self._orientation
+        ox, oy, oz = radians(ox), radians(oy), radians(oz)
+        self._seqlock.pack_into(
+            IMU_WORLD, IMU_WORLD_OFFSET, now,
+            int(clamp(ax, -8, 8) * ACCEL_FACTOR),
+            int(clamp(ay, -8, 8) * ACCEL_FACTOR),
+            int(clamp(az, -8, 8) * ACCEL_FACTOR),
+            int(clamp(gx, -500, 500) * GYRO_FACTOR),
+            int(clamp(gy, -500, 500) * GYRO_FACTOR),
+            int(clamp(gz, -500, 500) * GYRO_FACTOR),
+            int(clamp(cx, -4, 4) * COMPASS_FACTOR),
+            int(clamp(cy, -4, 4) * COMPASS_FACTOR),
+            int(clamp(cz, -4, 4) * COMPASS_FACTOR),
+            int(clamp(ox, -180, 180) * ORIENT_FACTOR),
+            int(clamp(oy, -180, 180) * ORIENT_FACTOR),
+            int(clamp(oz, -180, 180) * ORIENT_FACTOR),
+            )
@@ -19,9 +19,12 @@
 import sys
 import os
 import io
+import glob
 import errno
 from time import time, sleep
 
+from .common import shared_filename
+
 
 if sys.platform.startswith('win'):
     import ctypes
@@ -67,27 +70,39 @@ else:
             return True
 
 
-def lock_filename():
+def remove_stale(prefix):
     """
-    Return the filename used as a lock-file by applications that can drive the
-    emulation (currently sense_emu_gui and sense_play). On UNIX we try
-    ``/dev/shm`` then fall back to ``/tmp``; on Windows we use whatever
-    ``%TEMP%`` contains
+    Remove the files (such as sockets) named *prefix* followed by the PID of
+    the process that created them (optionally followed by a hyphen and
+    anything else) where that process no longer exists. Returns a list of the
+    remaining files with names starting with *prefix*.
     """
-    fname = 'rpi-sense-emu-pid'
-    if sys.platform.startswith('win'):
-        # just use a temporary file on Windows
-        return os.path.join(os.environ['TEMP'], fname)
-    else:
-        if os.path.exists('/dev/shm'):
-            return os.path.join('/dev/shm', fname)
+    result = []
+    for filename in glob.glob(prefix + '*'):
+        pid = filename[len(prefix):].split('-', 1)[0]
+        if pid.isdigit() and not pid_exists(int(pid)):
+            try:
+                os.unlink(filename)
+            except OSError:
+                # Presumably someone else got there first
+                pass
         else:
-            return os.path.join('/tmp', fname)
+            result.append(filename)
+    return result
+
+
+def lock_filename(instance=None):
+    """
+    Return the filename used as a lock-file by applications that can drive the
+    emulation (currently sense_emu_gui and sense_play) of the emulator
+    *instance* (see :func:`~sense_emu.common.shared_filename`).
+    """
+    return shared_filename('-pid', instance)
 
 
 class EmulatorLock:
-    def __init__(self, name):
-        self._filename = lock_filename()
+    def __init__(self, name, instance=None):
+        self._filename = lock_filename(instance)
         self.name = name # XXX not currently used
 
     def __enter__(self):
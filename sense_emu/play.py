@@ -30,6 +30,7 @@ from .imu import IMUServer
 from .pressure import PressureServer
 from .humidity import HumidityServer
 from .lock import EmulatorLock
+from .segment import open_segment
 
 
 class PlayApplication(TerminalApplication):
@@ -70,6 +71,8 @@ class PlayApplication(TerminalApplication):
                 'Another process is currently acting as the Sense HAT '
                 'emulator')
             return 1
+        segment = open_segment()
+        segment.start_writer()
         try:
             imu = IMUServer(simulate_world=False)
             psensor = PressureServer(simulate_noise=False)
@@ -96,6 +99,7 @@ class PlayApplication(TerminalApplication):
                 logging.warning(_('Skipped %d records during playback'), skipped)
             logging.info(_('Finished playback of %d records'), rec)
         finally:
+            segment.stop_writer()
             lock.release()
 
 
@@ -0,0 +1,349 @@
+# vim: set et sw=4 sts=4 fileencoding=utf-8:
+#
+# Raspberry Pi Sense HAT Emulator library for the Raspberry Pi
+# Copyright (c) 2016 Raspberry Pi Foundation <info@raspberrypi.org>
+#
+# This package is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This package is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>
+
+"""
+Renders images of the emulated Sense HAT board, as drawn by the emulator's
+GUI, using NumPy alone (PIL is used to load and scale the graphics assets).
+This requires neither GTK nor a display.
+"""
+
+import io
+import os
+import hashlib
+import tempfile
+from functools import lru_cache
+from collections import namedtuple
+
+import numpy as np
+import pkg_resources
+from PIL import Image
+
+
+# Size of the full size board image, and the position and size of the LED
+# matrix within it
+BOARD_WIDTH = 1063
+BOARD_HEIGHT = 821
+BOARD_LED_X = 126
+BOARD_LED_Y = 155
+BOARD_LED_SIZE = 512
+
+# The opacity of the orientation overlay
+ORIENT_ALPHA = 215 / 255
+
+Layers = namedtuple('Layers', (
+    'base', 'rect', 'index', 'palette', 'blend', 'blend_led', 'blend_k',
+    'blend_c'))
+
+
+def asset_cache_dir():
+    """
+    Return the directory in which decoded assets are cached; this is
+    ``sense_emu`` under ``$XDG_CACHE_HOME`` (which defaults to ``~/.cache``).
+    """
+    return os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or
+        os.path.join(os.path.expanduser('~'), '.cache'), 'sense_emu')
+
+
+@lru_cache(maxsize=None)
+def _load_asset(filename):
+    """
+    Return the packaged image *filename* as a read-only (height, width, 4)
+    array of RGBA values.
+
+    Decoding the PNG assets is a significant part of the GUI's start-up time,
+    so the decoded array is cached in :func:`asset_cache_dir`, named after a
+    hash of the image's content (so an upgraded asset is never confused with
+    an old one). Failure to read or write the cache is silently ignored.
+    """
+    data = pkg_resources.resource_string(__name__, filename)
+    cache = os.path.join(asset_cache_dir(), '{name}-{digest}.npy'.format(
+        name=os.path.splitext(filename)[0],
+        digest=hashlib.sha1(data).hexdigest()[:16]))
+    try:
+        result = np.load(cache, mmap_mode='r')
+        if result.ndim != 3 or result.shape[2] != 4 or result.dtype != np.uint8:
+            raise ValueError('invalid cached asset')
+    except (OSError, ValueError):
+        with Image.open(io.BytesIO(data)) as img:
+            result = np.array(img.convert('RGBA'), dtype=np.uint8)
+        try:
+            os.makedirs(os.path.dirname(cache), exist_ok=True)
+            # Write to a uniquely named temporary file and rename it so that
+            # concurrent instances (or threads) never load a partially written
+            # cache
+            temp = tempfile.NamedTemporaryFile(
+                dir=os.path.dirname(cache),
+                prefix=os.path.basename(cache) + '.', delete=False)
+            try:
+                with temp:
+                    np.save(temp, result)
+                os.replace(temp.name, cache)
+            except:
+                os.unlink(temp.name)
+                raise
+        except OSError:
+            pass
+    result.flags.writeable = False
+    return result
+
+
+def _scale_asset(filename, ratio):
+    """
+    Return the packaged image *filename* scaled by *ratio* (with bilinear
+    interpolation, as the GUI does) as a (height, width, 4) array of RGBA
+    values in the range 0 to 1.
+    """
+    asset = _load_asset(filename)
+    if ratio != 1.0:
+        height, width = asset.shape[:2]
+        asset = np.array(Image.fromarray(asset).resize(
+            (int(width * ratio), int(height * ratio)), Image.BILINEAR))
+    return asset.astype(np.float32) / 255
+
+
+def _over(top, bottom, alpha=1.0):
+    """
+    Composite the RGBA image *top* (with its alpha multiplied by *alpha*) over
+    *bottom*, both in the range 0 to 1.
+    """
+    top_a = top[..., 3:] * alpha
+    bottom_a = bottom[..., 3:] * (1 - top_a)
+    out_a = top_a + bottom_a
+    out = np.empty_like(bottom)
+    np.divide(
+        top[..., :3] * top_a + bottom[..., :3] * bottom_a, out_a,
+        out=out[..., :3], where=out_a > 0)
+    out[..., :3][np.broadcast_to(out_a == 0, out[..., :3].shape)] = 0
+    out[..., 3:] = out_a
+    return out
+
+
+def _rgba32(rgb):
+    """
+    Return the (..., 3) array of R,G,B values *rgb* as an array of opaque RGBA
+    values, each packed into a single 32-bit integer (in memory order).
+    """
+    rgba = np.empty(rgb.shape[:-1] + (4,), dtype=np.uint8)
+    rgba[..., :3] = rgb
+    rgba[..., 3] = 255
+    return rgba.view(np.uint32)[..., 0]
+
+
+@lru_cache(maxsize=8)
+def scaled_layers(ratio, orientation):
+    """
+    Return the pre-composited :class:`Layers` for rendering the board scaled
+    by *ratio*, with or without the *orientation* overlay.
+
+    Within the LED matrix, every layer above the LEDs (the pixel grid and the
+    optional orientation overlay) is composited over opaque LEDs, so each
+    rendered R,G,B value is simply an affine function of its LED's colour:
+    ``led * k + c``. Most of the grid is either transparent (``k == 1`` and
+    ``c == 0``, so the pixel is the LED's colour), or opaque (``k == 0``, so
+    the pixel is ``c`` and there are few distinct colours). Those pixels are
+    rendered with a single gather from a palette of the 64 LEDs followed by
+    the opaque colours; only the remaining pixels need any arithmetic. The
+    fields of the result are:
+
+    *base*
+        A read-only (height, width, 4) array of the RGBA board image, with the
+        LED matrix unlit.
+
+    *rect*
+        The (x, y, width, height) of the LED matrix within *base*.
+
+    *index*
+        A (height, width) array of the *rect*, indexing the palette for each
+        pixel (the LEDs are numbered 0 to 63 in row-major order).
+
+    *palette*
+        The packed RGBA values of the opaque colours, which follow the LEDs in
+        the palette.
+
+    *blend*, *blend_led*, *blend_k*, *blend_c*
+        The (row, column) indices of the pixels within *rect* which are
+        partially transparent, the LED beneath each, and their *k* and *c*
+        values.
+    """
+    board = _scale_asset('sense_emu.png', ratio)
+    grid_scaled = _scale_asset('pixel_grid.png', ratio)
+    x = int(BOARD_LED_X * ratio)
+    y = int(BOARD_LED_Y * ratio)
+    size = int(BOARD_LED_SIZE * ratio)
+    # The grid's scaled size may differ from the rect's by rounding; pad or
+    # crop it to fit
+    grid = np.zeros((size, size, 4), dtype=np.float32)
+    grid_size = min(size, grid_scaled.shape[0])
+    grid[:grid_size, :grid_size] = grid_scaled[:grid_size, :grid_size]
+    region = (slice(y, y + size), slice(x, x + size))
+
+    k = 1 - grid[..., 3]
+    c = grid[..., :3] * grid[..., 3:]
+    # Within the rect, the base image shows unlit (black) LEDs
+    base = board.copy()
+    base[region + (slice(None, 3),)] = c
+    base[region + (slice(3, 4),)] = 1
+    if orientation:
+        orient = _scale_asset('orientation.png', ratio)
+        orient_region = orient[region]
+        orient_a = orient_region[..., 3] * ORIENT_ALPHA
+        k = k * (1 - orient_a)
+        c = c * (1 - orient_a[..., np.newaxis]) + (
+            orient_region[..., :3] * orient_a[..., np.newaxis])
+        base = _over(orient, base, ORIENT_ALPHA)
+    base = np.round(base * 255).astype(np.uint8)
+    c = c * 255
+
+    leds = np.arange(size) * 8 // size
+    index = (leds[:, np.newaxis] * 8 + leds).astype(np.intp)
+    opaque = k == 0
+    colours, colour_index = np.unique(
+        np.round(c[opaque]).astype(np.uint8), axis=0, return_inverse=True)
+    index[opaque] = 64 + colour_index.reshape(-1)
+    blend = np.nonzero(~opaque & ((k != 1) | c.any(axis=2)))
+    result = Layers(
+        base=base,
+        rect=(x, y, size, size),
+        index=index,
+        palette=_rgba32(colours),
+        blend=blend,
+        blend_led=index[blend],
+        blend_k=k[blend][:, np.newaxis].astype(np.float32),
+        blend_c=c[blend].astype(np.float32),
+    )
+    for array in result + blend:
+        if isinstance(array, np.ndarray):
+            array.flags.writeable = False
+    return result
+
+
+class BoardRenderer:
+    """
+    Renders images of the emulated Sense HAT board, as the emulator's GUI
+    draws it, showing the LED matrix lit with given pixels. The board is
+    scaled by *ratio* (the full size image is 1063 x 821 pixels; ratios above
+    1 enlarge it, with bilinear interpolation like any other), rotated
+    anti-clockwise by *rotation* degrees (0, 90, 180 or 270), and optionally
+    overlaid with the orientation axes if *orientation* is ``True``.
+
+    The scaled board and its overlays are composited once (and cached across
+    renderers), so rendering a frame only computes the pixels of the LED
+    matrix. For example, to render the current state of the emulator's
+    screen::
+
+        from sense_emu.screen import ScreenClient
+        from sense_emu.render import BoardRenderer
+        from PIL import Image
+
+        renderer = BoardRenderer(ratio=0.5)
+        image = renderer.render(ScreenClient(notify=False).rgb_array)
+        Image.fromarray(image).save('board.png')
+    """
+    def __init__(self, ratio=1.0, rotation=0, orientation=False):
+        if not ratio > 0:
+            raise ValueError('ratio must be greater than 0')
+        if rotation not in (0, 90, 180, 270):
+            raise ValueError('rotation must be 0, 90, 180 or 270 degrees')
+        self._ratio = ratio
+        self._rotation = rotation
+        self._layers = scaled_layers(ratio, bool(orientation))
+        self._image = self._layers.base.copy()
+
+    @property
+    def ratio(self):
+        """
+        The scale of the rendered board relative to the full size image.
+        """
+        return self._ratio
+
+    @property
+    def rotation(self):
+        """
+        The rotation of the rendered board in degrees anti-clockwise.
+        """
+        return self._rotation
+
+    @property
+    def layers(self):
+        """
+        The :class:`Layers` used to render the board (before rotation).
+        """
+        return self._layers
+
+    @property
+    def led_rect(self):
+        """
+        The (x, y, width, height) of the LED matrix within the rendered images
+        (after rotation).
+        """
+        x, y, w, h = self._layers.rect
+        height, width = self._layers.base.shape[:2]
+        return {
+            0:   (x, y, w, h),
+            90:  (y, width - x - w, h, w),
+            180: (width - x - w, height - y - h, w, h),
+            270: (height - y - h, x, h, w),
+        }[self._rotation]
+
+    @property
+    def size(self):
+        """
+        The (width, height) of the rendered images.
+        """
+        height, width = self._layers.base.shape[:2]
+        if self._rotation in (90, 270):
+            return height, width
+        return width, height
+
+    def render_leds(self, pixels, out=None):
+        """
+        Render the LED matrix alone (without rotation), lit with *pixels*, an
+        (8, 8, 3) array of R,G,B values as returned by
+        :attr:`~sense_emu.screen.ScreenClient.rgb_array`. Returns a
+        (height, width, 4) array of the RGBA pixels within
+        :attr:`Layers.rect`. If *out* is specified, the result is written to
+        it instead of a new array.
+        """
+        layers = self._layers
+        pixels = np.asarray(pixels, dtype=np.uint8).reshape((64, 3))
+        if out is None:
+            out = np.empty(layers.index.shape + (4,), dtype=np.uint8)
+        palette = np.concatenate((_rgba32(pixels), layers.palette))
+        out32 = out.view(np.uint32)[..., 0]
+        np.take(palette, layers.index, out=out32, mode='clip')
+        blended = pixels[layers.blend_led] * layers.blend_k
+        blended += layers.blend_c
+        out32[layers.blend] = _rgba32(np.rint(blended))
+        return out
+
+    def render(self, pixels, out=None):
+        """
+        Render the board with the LED matrix lit with *pixels*, an (8, 8, 3)
+        array of R,G,B values as returned by
+        :attr:`~sense_emu.screen.ScreenClient.rgb_array`. Returns a
+        (height, width, 4) array of RGBA values (see :attr:`size`). If *out*
+        is specified, the result is written to it instead of a new array.
+        """
+        x, y, w, h = self._layers.rect
+        self.render_leds(pixels, out=self._image[y:y + h, x:x + w])
+        result = np.rot90(self._image, self._rotation // 90)
+        if out is None:
+            return result.copy()
+        out[...] = result
+        return out
@@ -0,0 +1,165 @@
+# vim: set et sw=4 sts=4 fileencoding=utf-8:
+#
+# Raspberry Pi Sense HAT Emulator library for the Raspberry Pi
+# Copyright (c) 2016 Raspberry Pi Foundation <info@raspberrypi.org>
+#
+# This package is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This package is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>
+
+import heapq
+import logging
+from time import monotonic
+from itertools import count
+from threading import Thread, Condition, current_thread
+
+
+class ScheduledJob:
+    """
+    A callback run periodically by a :class:`Scheduler`. Instances are
+    returned by :meth:`Scheduler.add`; call :meth:`cancel` to stop the
+    callback running.
+    """
+    def __init__(self, scheduler, interval, callback):
+        self.interval = interval
+        self.callback = callback
+        self.skipped = 0
+        self.errors = 0
+        self.last_error = None
+        self._scheduler = scheduler
+        self._active = True
+        self._logged = None
+        self._logged_errors = 0
+
+    def cancel(self):
+        """
+        Stop running the callback. If it is running (in another thread) this
+        waits for it to finish, so the callback never runs after this
+        returns.
+        """
+        self._scheduler.remove(self)
+
+
+class Scheduler:
+    """
+    Runs periodic callbacks (like the sensor servers' updates) from a single
+    background thread, which is started when the first callback is added and
+    exits when the last is removed.
+
+    Each callback is run at absolute deadlines measured on the monotonic
+    clock, so the time taken to run it doesn't add to its period. If a
+    callback runs late, it runs once more immediately to catch up; if it's
+    more than one interval late, the missed runs are skipped (and counted in
+    :attr:`ScheduledJob.skipped`) rather than run back to back.
+
+    A callback which raises an exception is still rescheduled (a transient
+    error mustn't stop a sensor, or the heartbeat of the emulator, for good).
+    Its exceptions are counted in :attr:`ScheduledJob.errors`, the last is
+    kept in :attr:`ScheduledJob.last_error`, and they are logged at most once
+    every :attr:`log_interval` seconds per callback.
+    """
+    log_interval = 10
+
+    def __init__(self):
+        self._lock = Condition()
+        self._queue = []
+        self._order = count()
+        self._thread = None
+        self._running = None
+
+    def add(self, interval, callback):
+        """
+        Run *callback* every *interval* seconds, starting *interval* seconds
+        from now. Returns a :class:`ScheduledJob`.
+        """
+        if interval <= 0:
+            raise ValueError('interval must be greater than 0')
+        job = ScheduledJob(self, interval, callback)
+        with self._lock:
+            self._push(monotonic() + interval, job)
+            if self._thread is None:
+                self._thread = Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+            self._lock.notify_all()
+        return job
+
+    def remove(self, job):
+        """
+        Stop running the callback of *job*, waiting for it to finish if it's
+        running in the scheduler's thread (unless called from that thread).
+        """
+        with self._lock:
+            job._active = False
+            self._queue = [entry for entry in self._queue if entry[2] is not job]
+            heapq.heapify(self._queue)
+            if current_thread() is not self._thread:
+                while self._running is job:
+                    self._lock.wait()
+            self._lock.notify_all()
+
+    def _failed(self, job, exc):
+        job.errors += 1
+        job.last_error = exc
+        now = monotonic()
+        if job._logged is None:
+            logging.exception('Error in scheduled callback %r', job.callback)
+        elif now - job._logged >= self.log_interval:
+            logging.error(
+                'Scheduled callback %r failed %d more times; last error: %r',
+                job.callback, job.errors - job._logged_errors, exc)
+        else:
+            return
+        job._logged = now
+        job._logged_errors = job.errors
+
+    def _push(self, deadline, job):
+        # The counter breaks ties between equal deadlines (jobs themselves
+        # aren't comparable)
+        heapq.heappush(self._queue, (deadline, next(self._order), job))
+
+    def _run(self):
+        with self._lock:
+            while self._queue:
+                deadline, _, job = self._queue[0]
+                now = monotonic()
+                if deadline > now:
+                    self._lock.wait(deadline - now)
+                    continue
+                heapq.heappop(self._queue)
+                self._running = job
+                self._lock.release()
+                try:
+                    job.callback()
+                except Exception as e:
+                    # Don't let one failing callback stop the others (or
+                    # itself)
+                    self._failed(job, e)
+                finally:
+                    self._lock.acquire()
+                    self._running = None
+                    self._lock.notify_all()
+                # Only reschedule the job if it wasn't removed while its
+                # callback was running
+                if job._active:
+                    deadline += job.interval
+                    late = monotonic() - deadline
+                    if late >= job.interval:
+                        missed = int(late // job.interval)
+                        job.skipped += missed
+                        deadline += missed * job.interval
+                    self._push(deadline, job)
+            self._thread = None
+
+
+# The scheduler shared by all the sensor servers in a process
+scheduler = Scheduler()
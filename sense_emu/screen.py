@@ -18,14 +18,52 @@
 
 import sys
 import os
-import io
 import errno
-import mmap
 import struct
-from threading import Thread, Event
+import select
+import socket
+import itertools
+from time import sleep, monotonic
+from threading import Event, Lock
+from collections import namedtuple
 
 import numpy as np
 
+from .common import shared_filename
+from .segment import open_segment
+from .lock import remove_stale, pid_exists
+from .stick import stick_client_prefix
+
+
+# The screen's registers (in the shared segment) hold the LED states as RGB565
+# values followed by the user-controlled gamma table. They are protected by the
+# screen's sequence number: writers increment it before and after every update
+# so it is odd while an update is in progress; readers retry their copy of the
+# frame if the number changed while they were copying (a "seqlock"),
+# guaranteeing they only ever see complete frames.
+#
+# These are followed by a log of the last SCREEN_COMMITS frames committed
+# (each with the sequence number it completed, and the time of the commit) so
+# that recorders can see every frame, even those replaced before they could
+# read the LED states, and a table of the recorders reading the log (see
+# CommitLog)
+PIXELS_OFFSET = 0
+GAMMA_OFFSET = PIXELS_OFFSET + 128
+COMMITS_OFFSET = GAMMA_OFFSET + 32
+SCREEN_COMMIT = np.dtype([
+    ('sequence', '=u8'),
+    ('timestamp', '=f8'),
+    ('screen', '=u2', (8, 8)),
+    ('gamma', 'u1', 32),
+    ])
+SCREEN_COMMITS = 256
+RECORDERS_OFFSET = COMMITS_OFFSET + SCREEN_COMMIT.itemsize * SCREEN_COMMITS
+SCREEN_RECORDER = np.dtype([
+    ('pid', '=i8'),      # PID of the recorder (0 if the entry is free)
+    ('sequence', '=u8'), # sequence number of the last commit it read
+    ])
+SCREEN_RECORDERS = 8
+SCREEN_SIZE = RECORDERS_OFFSET + SCREEN_RECORDER.itemsize * SCREEN_RECORDERS
 
 GAMMA_DEFAULT = [
     0,  0,  0,  0,  0,  0,  1,  1,
@@ -38,106 +76,495 @@ GAMMA_LOW = [
     3,  3,  3,  4,  4,  5,  5,  6,
     6,  7,  7,  8,  8,  9,  10, 10]
 
+# Lookup tables for conversion between 24-bit RGB and the 16-bit RGB565 values
+# stored in the frame-buffer. Packing ORs together one entry from each of the
+# _RGB565_R, _RGB565_G, and _RGB565_B tables; unpacking is a single gather from
+# the 65536 x 3 _RGB565_UNPACK table
+_RGB565_R = (np.arange(256, dtype=np.uint16) >> 3) << 11
+_RGB565_G = (np.arange(256, dtype=np.uint16) >> 2) << 5
+_RGB565_B = (np.arange(256, dtype=np.uint16) >> 3)
+_RGB565_UNPACK = np.empty((65536, 3), dtype=np.uint8)
+_RGB565_UNPACK[:, 0] = (np.arange(65536) & 0xF800) >> 8
+_RGB565_UNPACK[:, 1] = (np.arange(65536) & 0x07E0) >> 3
+_RGB565_UNPACK[:, 2] = (np.arange(65536) & 0x001F) << 3
+# The 5-bit R,G,B values (the hardware drops the least significant bit of
+# green) of each RGB565 value, which index the gamma table
+_RGB565_RGB555 = np.empty((65536, 3), dtype=np.uint8)
+_RGB565_RGB555[:, 0] = (np.arange(65536) & 0xF800) >> 11
+_RGB565_RGB555[:, 1] = (np.arange(65536) & 0x07E0) >> 6
+_RGB565_RGB555[:, 2] = (np.arange(65536) & 0x001F)
+# The final gamma correction lookup table. This is equivalent to gamma
+# correction of 1/4 (*much* brighter) because the HAT's RGB LEDs are much
+# brighter than a corresponding LCD display. It also uses a non-zero starting
+# point so that LEDs that are off appear gray
+_GAMMA_RGBLED = (np.sqrt(np.sqrt(np.linspace(0.05, 1, 32))) * 255).astype(np.uint8)
+
+
+def pack_rgb565(pixels):
+    """
+    Return an array of 16-bit RGB565 values packed from the array *pixels*,
+    the last dimension of which must contain R, G, B values between 0 and 255.
+    The result has the shape of *pixels* without its last dimension.
+    """
+    return (
+        _RGB565_R[pixels[..., 0]] |
+        _RGB565_G[pixels[..., 1]] |
+        _RGB565_B[pixels[..., 2]])
+
+
+def unpack_rgb565(packed):
+    """
+    Return an array of 8-bit R, G, B values unpacked from the array of 16-bit
+    RGB565 values *packed*. The result has the shape of *packed* with an extra
+    dimension (of length 3) added.
+    """
+    return _RGB565_UNPACK[packed]
 
-def screen_filename():
-    # returns the file used to represent the state of the emulated sense HAT's
-    # screen. On UNIX we try /dev/shm then fall back to /tmp; on Windows we
-    # use whatever %TEMP% points at
-    fname = 'rpi-sense-emu-screen'
+
+def display_lut(gamma):
+    """
+    Return a 65536 x 3 lookup table mapping each RGB565 value to the R,G,B
+    value it is displayed as by the emulator, given the 32-element *gamma*
+    table from the frame-buffer.
+    """
+    # Convert the RGB565 pixels to RGB555 (as the real hardware does) and map
+    # them through the user's gamma table, then ours
+    return np.take(_GAMMA_RGBLED, np.take(gamma, _RGB565_RGB555))
+
+
+def screen_notify_prefix(instance=None):
+    """
+    Return the path prefix of the sockets bound by viewers of the emulated
+    sense HAT's screen of the emulator *instance* to receive notification of
+    screen updates (each viewer appends a unique suffix). On UNIX these live
+    alongside the instance's other shared files (see
+    :func:`~sense_emu.common.shared_filename`); on Windows notifications are
+    not supported and ``None`` is returned (viewers poll the frame sequence
+    number instead).
+    """
     if sys.platform.startswith('win'):
-        # just use a temporary file on Windows
-        return os.path.join(os.environ['TEMP'], fname)
+        return None
     else:
-        if os.path.exists('/dev/shm'):
-            return os.path.join('/dev/shm', fname)
-        else:
-            return os.path.join('/tmp', fname)
-
-
-def init_screen():
-    try:
-        # Attempt to open the screen's device file and ensure it's 160 bytes
-        # long
-        fd = io.open(screen_filename(), 'r+b', buffering=0)
-        fd.seek(160)
-        fd.truncate()
-    except IOError as e:
-        # If the screen's device file doesn't exist, create it with reasonable
-        # initial values
-        if e.errno == errno.ENOENT:
-            fd = io.open(screen_filename(), 'w+b', buffering=0)
-            fd.write(b'\x00\x00' * 64)
-            fd.write(b''.join(chr(i).encode('ascii') for i in GAMMA_DEFAULT))
+        return shared_filename('-screen-', instance)
+
+
+def init_screen(registers):
+    """
+    Initialize the screen's *registers* (a zeroed buffer) with reasonable
+    initial values when the shared segment is created.
+    """
+    registers[GAMMA_OFFSET:GAMMA_OFFSET + 32] = bytes(bytearray(GAMMA_DEFAULT))
+
+
+class CommitLog:
+    """
+    The log of the last :data:`SCREEN_COMMITS` frames committed to the
+    screen, and the table of the recorders reading it, in the screen's
+    *registers*.
+
+    Each commit is logged by its writer (to the entry indexed by half its
+    sequence number, modulo :data:`SCREEN_COMMITS`) while the sequence number
+    is odd. Before a writer starts a commit it calls :meth:`reserve`, which
+    waits for every attached recorder to read the entry about to be
+    overwritten, so recorders never miss a commit. A recorder which doesn't
+    keep up within :attr:`timeout` seconds is detached (and will count the
+    commits it missed); one whose process has died is detached immediately.
+    """
+    timeout = 1
+
+    _attach_lock = Lock()
+
+    def __init__(self, registers):
+        self._registers = registers
+        self._commits = np.frombuffer(
+            registers, dtype=SCREEN_COMMIT, count=SCREEN_COMMITS,
+            offset=COMMITS_OFFSET)
+        self._recorders = np.frombuffer(
+            registers, dtype=SCREEN_RECORDER, count=SCREEN_RECORDERS,
+            offset=RECORDERS_OFFSET)
+        # Every commit is logged (and checks for recorders), so the views of
+        # the fields are constructed once, and the check for recorders avoids
+        # NumPy entirely
+        self._sequences = self._commits['sequence']
+        self._timestamps = self._commits['timestamp']
+        self._screens = self._commits['screen']
+        self._gammas = self._commits['gamma']
+        self._pids = struct.Struct('=' + 'q8x' * SCREEN_RECORDERS)
+
+    def reserve(self, sequence):
+        """
+        Called by the writer before starting the commit that will complete
+        the *sequence* number; waits for the recorders to read the commit
+        whose entry it will overwrite.
+        """
+        if not any(self._pids.unpack_from(self._registers, RECORDERS_OFFSET)):
+            return
+        pids = self._recorders['pid']
+        oldest = sequence - 2 * SCREEN_COMMITS
+        deadline = None
+        while True:
+            behind = np.flatnonzero(
+                (pids != 0) & (self._recorders['sequence'] < max(0, oldest)))
+            for slot in behind:
+                if not pid_exists(int(pids[slot])):
+                    pids[slot] = 0
+            behind = behind[pids[behind] != 0]
+            if not len(behind):
+                return
+            if deadline is None:
+                deadline = monotonic() + self.timeout
+            elif monotonic() > deadline:
+                pids[behind] = 0
+                return
+            sleep(0.001)
+
+    def log(self, sequence, timestamp, screen, gamma):
+        """
+        Called by the writer to log the frame *screen* (an 8 x 8 array of
+        RGB565 values) with the *gamma* table, which completes the *sequence*
+        number at *timestamp*.
+        """
+        index = (sequence // 2) % SCREEN_COMMITS
+        self._sequences[index] = sequence
+        self._timestamps[index] = timestamp
+        self._screens[index] = screen
+        self._gammas[index] = gamma
+
+    def attach(self, sequence):
+        """
+        Attach a recorder that has read every commit up to the *sequence*
+        number. Returns the recorder's slot, or ``None`` if there are too
+        many recorders.
+        """
+        with self._attach_lock:
+            pid = os.getpid()
+            for slot, recorder in enumerate(self._recorders):
+                if recorder['pid'] == 0 or not pid_exists(int(recorder['pid'])):
+                    # Set the sequence number before the PID, so a writer
+                    # never waits on the last recorder in the slot
+                    self._recorders['sequence'][slot] = sequence
+                    self._recorders['pid'][slot] = pid
+                    # Another process may have claimed the slot at the same
+                    # time; whichever wrote its PID last has it
+                    sleep(0)
+                    if self._recorders['pid'][slot] == pid:
+                        return slot
+        return None
+
+    def detach(self, slot):
+        """
+        Detach the recorder in *slot*.
+        """
+        if self.attached(slot):
+            self._recorders['pid'][slot] = 0
+
+    def attached(self, slot):
+        """
+        Returns ``True`` if the recorder in *slot* is (still) attached.
+        """
+        return slot is not None and self._recorders['pid'][slot] == os.getpid()
+
+    def read(self, sequence, current, slot=None):
+        """
+        Return a tuple of (commits, missed) for the frames committed after
+        the *sequence* number up to the *current* sequence number: a list of
+        :class:`ScreenCommit` tuples (in order), and the number of frames no
+        longer in the log. If *slot* is given, the recorder in it is marked
+        as having read up to *current*.
+        """
+        # While a frame is being committed, the entry of the oldest frame in
+        # the log is being overwritten, so it can't be read
+        first = max(sequence + 2, current - 2 * (SCREEN_COMMITS - 2))
+        expected = np.arange(first, current + 2, 2, dtype=np.uint64)
+        entries = self._commits[(expected // 2) % SCREEN_COMMITS]
+        # If a commit overwrote any of the entries while they were being
+        # copied, the sequence numbers in them won't match; the writer logs
+        # an entry's sequence number first so a torn entry is detected either
+        # way
+        entries = entries[
+            (entries['sequence'] == expected) &
+            (self._sequences[(expected // 2) % SCREEN_COMMITS] == expected)]
+        if self.attached(slot):
+            self._recorders['sequence'][slot] = current
+        result = [
+            ScreenCommit(
+                int(entry['sequence']), float(entry['timestamp']),
+                entry['screen'].copy(), entry['gamma'].copy())
+            for entry in entries
+            ]
+        return result, (current - sequence) // 2 - len(result)
+
+
+ScreenCommit = namedtuple(
+    'ScreenCommit', ('sequence', 'timestamp', 'screen', 'gamma'))
+
+
+class ScreenNotifier:
+    """
+    Notifies all viewers of the screen (:class:`ScreenClient` instances) that
+    a frame has been written. The set of viewers is discovered by scanning for
+    their sockets when a viewer binds or removes its socket (which it signals
+    through :attr:`~sense_emu.segment.Segment.clients`), or every
+    :attr:`rescan` seconds regardless, so sending a notification is normally a
+    single non-blocking datagram per viewer. The scan also removes the sockets
+    of viewers and joystick clients (see :class:`~sense_emu.stick.SenseStick`)
+    whose processes have died.
+    """
+    rescan = 10
+
+    def __init__(self, instance=None):
+        self._segment = open_segment(instance)
+        self._prefix = screen_notify_prefix(instance)
+        self._client_prefix = stick_client_prefix(instance)
+        self._viewers = []
+        self._scanned = None
+        self._scanned_clients = None
+        if self._prefix is None:
+            self._socket = None
         else:
-            raise
-    return fd
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._socket.setblocking(False)
+
+    def close(self):
+        if self._socket:
+            self._socket.close()
+            self._socket = None
+
+    def notify(self):
+        if self._socket is None:
+            return
+        now = monotonic()
+        clients = self._segment.clients
+        if (
+                self._scanned is None or now - self._scanned > self.rescan or
+                clients != self._scanned_clients):
+            # Viewers and joystick clients killed before they could remove
+            # their sockets would otherwise accumulate in the directory
+            self._viewers = remove_stale(self._prefix)
+            remove_stale(self._client_prefix)
+            self._scanned = now
+            self._scanned_clients = clients
+        for viewer in list(self._viewers):
+            try:
+                self._socket.sendto(b'\x01', viewer)
+            except socket.error as e:
+                if e.errno in (errno.ENOENT, errno.ECONNREFUSED):
+                    # The viewer has gone; if it died without removing its
+                    # socket, clean up after it
+                    self._viewers.remove(viewer)
+                    if e.errno == errno.ECONNREFUSED:
+                        try:
+                            os.unlink(viewer)
+                        except OSError:
+                            pass
+                elif e.errno not in (
+                        errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS):
+                    # A full queue (EAGAIN et al.) just means the viewer has
+                    # plenty of pending notifications already
+                    raise
 
 
 class ScreenClient:
-    def __init__(self):
-        self._fd = init_screen()
-        self._map = mmap.mmap(self._fd.fileno(), 0, access=mmap.ACCESS_READ)
-        # Construct arrays representing the LED states (_screen) and the user
-        # controlled gamma lookup table (_gamma)
-        self._screen = np.frombuffer(self._map, dtype=np.uint16, count=64).reshape((8, 8))
-        self._gamma = np.frombuffer(self._map, dtype=np.uint8, count=32, offset=128)
-        # Construct the final gamma correction lookup table. This is equivalent
-        # to gamma correction of 1/4 (*much* brighter) because the HAT's RGB
-        # LEDs are much brighter than a corresponding LCD display. It also uses
-        # a non-zero starting point so that LEDs that are off appear gray
-        self._gamma_rgbled = (
-                np.sqrt(np.sqrt(np.linspace(0.05, 1, 32))) * 255
-                ).astype(np.uint8)
-        self._touch_stop = Event()
-        self._touch_thread = Thread(target=self._touch_run)
-        self._touch_thread.daemon = True
-        self._touch_thread.start()
+    """
+    Reads the emulated LED matrix of the emulator *instance*.
+
+    If *notify* is ``True`` (the default), the client registers to be notified
+    of every frame committed to the screen, so that :meth:`wait` returns
+    promptly. Every writer pays for each registered client on every commit,
+    so clients that never call :meth:`wait` (or only poll :attr:`sequence`)
+    should pass ``False``; :meth:`wait` then polls instead.
+    """
+    _counter = itertools.count()
+
+    def __init__(self, instance=None, notify=True, record=False):
+        segment = open_segment(instance)
+        registers = segment.region('screen')
+        self._segment = segment
+        self._seqlock = segment.seqlock('screen')
+        # Construct arrays representing the frame sequence number (_sequence),
+        # the LED states (_screen) and the user controlled gamma lookup table
+        # (_gamma) in the shared segment. The latter two are only ever read by
+        # _read which copies them to _screen_copy and _gamma_copy
+        self._sequence = np.frombuffer(
+            segment.map, dtype=np.uint64, count=1,
+            offset=segment.sequence_offset('screen'))
+        self._screen = np.frombuffer(
+            registers, dtype=np.uint16, count=64,
+            offset=PIXELS_OFFSET).reshape((8, 8))
+        self._gamma = np.frombuffer(
+            registers, dtype=np.uint8, count=32, offset=GAMMA_OFFSET)
+        self._log = CommitLog(registers)
+        self._recorder = None
+        if record:
+            self._recorder = self._log.attach(self.sequence)
+        self._screen_copy = np.zeros((8, 8), dtype=np.uint16)
+        self._gamma_copy = np.zeros(32, dtype=np.uint8)
+        # The combined RGB565 to (gamma corrected) RGB888 lookup table used by
+        # get_rgb_array; this is rebuilt whenever the gamma table changes
+        self._rgb_lut = None
+        self._rgb_lut_gamma = None
+        # Bind the socket on which writers notify us of new frames (see
+        # ScreenNotifier); where that's not supported (or not wanted), wait
+        # polls instead
+        self._woken = Event()
+        prefix = screen_notify_prefix(instance)
+        if prefix is None or not notify:
+            self._notify = None
+        else:
+            addr = '%s%d-%d' % (prefix, os.getpid(), next(self._counter))
+            try:
+                os.unlink(addr)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+            self._notify = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._notify.setblocking(False)
+            self._notify.bind(addr)
+            segment.clients_changed()
 
     def close(self):
-        if self._fd:
-            self._touch_stop.set()
-            self._touch_thread.join()
-            self._touch_thread = None
-            self._map.close()
-            self._map = None
-            self._fd.close()
-            self._fd = None
-
-    def _touch_run(self):
-        # "touch" the screen's frame-buffer once a second. This ensures that
-        # the screen always updates at least once a second and works around the
-        # issue that screen updates can be lost due to lack of resolution of
-        # the file modification timestamps. Unfortunately, futimes(3) is not
-        # universally supported, and only available in Python 3.3+ so this gets
-        # a bit convoluted...
-        # FIXME only need 3.3+ support now; work out which bits are 2.7 and excise
-        touch = lambda: os.utime(self._fd.fileno())
+        if self._sequence is not None:
+            if self._notify:
+                addr = self._notify.getsockname()
+                self._notify.close()
+                self._notify = None
+                try:
+                    os.unlink(addr)
+                except OSError:
+                    pass
+                else:
+                    self._segment.clients_changed()
+            self._log.detach(self._recorder)
+            self._sequence = self._screen = self._gamma = None
+            self._log = self._recorder = None
+            self._seqlock = None
+
+    def _read(self):
+        """
+        Copy the LED states and gamma table from the shared mapping into
+        _screen_copy and _gamma_copy, returning the sequence number of the
+        copied frame. If a writer is part way through an update, the copy is
+        retried until it's consistent (see
+        :meth:`~sense_emu.common.SeqLock.read`).
+        """
+        return self._seqlock.read(self._copy)[0]
+
+    def _copy(self):
+        self._screen_copy[...] = self._screen
+        self._gamma_copy[...] = self._gamma
+
+    def _drain(self):
+        # Discard all pending notifications
         try:
-            if os.utime in os.supports_fd:
-                touch()
+            while self._notify.recv(64):
+                pass
+        except socket.error as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+
+    def wait(self, sequence, timeout=None):
+        """
+        Wait up to *timeout* seconds (indefinitely if *timeout* is ``None``)
+        for the :attr:`sequence` number to differ from *sequence*. Returns
+        ``True`` if it does, or ``False`` if the timeout expires, or
+        :meth:`wake` is called first.
+        """
+        if timeout is not None:
+            deadline = monotonic() + timeout
+        while True:
+            if self._notify:
+                self._drain()
+            if self.sequence != sequence:
+                return True
+            if self._woken.is_set():
+                self._woken.clear()
+                return False
+            if timeout is None:
+                remaining = None
+            else:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    return False
+            if self._notify:
+                select.select([self._notify], [], [], remaining)
             else:
-                raise NotImplementedError
-        except (AttributeError, NotImplementedError) as e:
-            touch = lambda: os.utime(self._fd.name, None)
-        while not self._touch_stop.wait(1):
-            touch()
+                self._woken.wait(
+                    0.01 if remaining is None else min(remaining, 0.01))
+
+    def wake(self):
+        """
+        Cause a thread blocked in :meth:`wait` to return ``False``
+        immediately.
+        """
+        self._woken.set()
+        if self._notify:
+            try:
+                self._notify.sendto(b'\x00', self._notify.getsockname())
+            except socket.error as e:
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS):
+                    raise
 
     @property
-    def array(self):
-        return self._screen
+    def sequence(self):
+        """
+        The sequence number of the last complete frame written to the screen.
+        This changes every time a frame (or the gamma table) is written, so
+        comparing it with a prior value is a cheap means of determining
+        whether the screen has changed.
+        """
+        return int(self._sequence[0]) & ~1
+
+    def read(self):
+        """
+        Return a tuple of (sequence, screen, gamma) for the last complete
+        frame: its :attr:`sequence` number, a copy of its LED states as an
+        8 x 8 array of RGB565 values, and a copy of its 32-element gamma
+        table.
+        """
+        sequence = self._read()
+        return sequence, self._screen_copy.copy(), self._gamma_copy.copy()
+
+    def commits(self, sequence):
+        """
+        Return a tuple of (sequence, commits, missed) for the frames committed
+        after the *sequence* number: the sequence number of the last of them,
+        a list of :class:`ScreenCommit` tuples (in order), and the number of
+        frames no longer in the emulator's log of commits.
+
+        Unless the client was constructed with *record* set, writers don't
+        wait for it to read the log, so frames are missed if it falls more
+        than :data:`SCREEN_COMMITS` commits behind.
+        """
+        current = self.sequence
+        if current < sequence:
+            # The segment has been re-created; start again with its current
+            # frame
+            sequence = current - 2
+        if self._recorder is not None and not self._log.attached(self._recorder):
+            # We were detached for falling too far behind; try again
+            self._recorder = self._log.attach(sequence)
+        commits, missed = self._log.read(sequence, current, self._recorder)
+        return current, commits, missed
 
     @property
-    def rgb_array(self):
-        a = np.empty((8, 8, 3), dtype=np.uint8)
-        # convert the RGB565 pixels to RGB555 (as the real hardware does)
-        a[..., 0] = ((self._screen & 0xF800) >> 11).astype(np.uint8)
-        a[..., 1] = ((self._screen & 0x07E0) >> 6).astype(np.uint8)
-        a[..., 2] = (self._screen & 0x001F).astype(np.uint8)
-        # map all values according to the gamma table
-        a = np.take(self._gamma, a)
-        a = np.take(self._gamma_rgbled, a)
-        return a
+    def array(self):
+        self._read()
+        return self._screen_copy.copy()
+
+    def get_rgb_array(self, out=None):
+        """
+        Return the LED states as an (8, 8, 3) array of gamma corrected R,G,B
+        values, as they should be displayed. If *out* is specified, it must be
+        an (8, 8, 3) :class:`numpy.uint8` array which will be filled and
+        returned instead of allocating a new array.
+        """
+        self._read()
+        gamma = self._gamma_copy.tobytes()
+        if gamma != self._rgb_lut_gamma:
+            self._rgb_lut = display_lut(self._gamma_copy)
+            self._rgb_lut_gamma = gamma
+        return np.take(self._rgb_lut, self._screen_copy, axis=0, out=out)
 
     @property
-    def timestamp(self):
-        return os.fstat(self._fd.fileno()).st_mtime
+    def rgb_array(self):
+        return self.get_rgb_array()
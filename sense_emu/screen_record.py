@@ -0,0 +1,137 @@
+# vim: set et sw=4 sts=4 fileencoding=utf-8:
+#
+# Raspberry Pi Sense HAT Emulator library for the Raspberry Pi
+# Copyright (c) 2016 Raspberry Pi Foundation <info@raspberrypi.org>
+#
+# This package is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This package is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see <http://www.gnu.org/licenses/>
+
+
+import os
+import logging
+import warnings
+from time import time, sleep
+
+from . import __version__
+from .i18n import _
+from .terminal import TerminalApplication, FileType
+from .screen_trace import (
+    ScreenRecorder,
+    load_trace,
+    render_frames,
+    save_png_sheets,
+    save_gif,
+    )
+
+
+class ScreenRecordApplication(TerminalApplication):
+    def __init__(self):
+        super(ScreenRecordApplication, self).__init__(
+            version=__version__,
+            description=_("Records the frames drawn on the Sense HAT "
+                "emulator's LED matrix to a trace file, and renders traces "
+                "to PNG sheets or animated GIFs."))
+        commands = self.parser.add_subparsers(
+            dest='command', title=_('commands'))
+        commands.required = True
+        record = commands.add_parser(
+            'record', description=_('Record frames drawn on the emulated '
+            'LED matrix until the duration expires, or terminated with Ctrl+C'),
+            help=_('record a screen trace'))
+        record.add_argument(
+            '-d', '--duration', dest='duration', action='store', default=0.0,
+            type=float, metavar='SECS',
+            help=_('the duration to record for in seconds (default: record '
+            'until terminated with Ctrl+C)'))
+        record.add_argument(
+            '-i', '--instance', dest='instance', action='store', default=None,
+            metavar='NAME',
+            help=_('the name of the emulator instance to record (default: '
+            'the value of SENSE_EMU_INSTANCE, or the default instance)'))
+        record.add_argument('output', type=FileType('wb'))
+        render = commands.add_parser(
+            'render', description=_('Render a screen trace to PNG sheets, or '
+            'an animated GIF, depending on the extension of the output '
+            'filename'),
+            help=_('render a screen trace to images'))
+        render.add_argument(
+            '-s', '--scale', dest='scale', action='store', default=16,
+            type=int, metavar='PIXELS',
+            help=_('the size of each LED in the output (default: %(default)s)'))
+        render.add_argument(
+            '-c', '--columns', dest='columns', action='store', default=8,
+            type=int, metavar='NUM',
+            help=_('the number of frames across each PNG sheet (default: '
+            '%(default)s)'))
+        render.add_argument(
+            '-r', '--rows', dest='rows', action='store', default=8,
+            type=int, metavar='NUM',
+            help=_('the number of frames down each PNG sheet (default: '
+            '%(default)s)'))
+        render.add_argument('input', type=FileType('rb'))
+        render.add_argument('output')
+
+    def main(self, args):
+        if args.command == 'record':
+            self.record(args)
+        else:
+            self.render(args)
+
+    def record(self, args):
+        logging.info(_('Starting recording'))
+        if args.duration:
+            terminate_at = time() + args.duration
+        else:
+            terminate_at = time() + 1e100
+        recorder = ScreenRecorder(args.output, args.instance)
+        try:
+            while True:
+                remaining = terminate_at - time()
+                if remaining <= 0:
+                    break
+                sleep(min(1.0, remaining))
+                logging.info(_('%d frames written'), recorder.frames)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            # The number of missed frames is reported below, rather than by
+            # the recorder's warning
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                recorder.close()
+            logging.info(
+                _('Finishing recording after %d frames'), recorder.frames)
+            if recorder.missed:
+                logging.warning(
+                    _('%d frames were drawn too quickly to record'),
+                    recorder.missed)
+            args.output.close()
+
+    def render(self, args):
+        ext = os.path.splitext(args.output)[1].lower()
+        if ext not in ('.png', '.gif'):
+            raise ValueError(_('output filename must end with .png or .gif'))
+        trace = load_trace(args.input)
+        if not len(trace.timestamp):
+            raise ValueError(_('the trace contains no frames'))
+        logging.info(_('Rendering %d frames'), len(trace.timestamp))
+        images = render_frames(trace.screen, trace.gamma, args.scale)
+        if ext == '.gif':
+            save_gif(args.output, trace.timestamp, images)
+        else:
+            for filename in save_png_sheets(
+                    args.output, images, args.columns, args.rows):
+                logging.info(_('Wrote %s'), filename)
+
+
+app = ScreenRecordApplication()
@@ -0,0 +1,337 @@
+# vim: set et sw=4 sts=4 fileencoding=utf-8:
+#
+# Raspberry Pi Sense HAT Emulator library for the Raspberry Pi
+# Copyright (c) 2016 Raspberry Pi Foundation <info@raspberrypi.org>
+#
+# This package is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This package is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>
+
+"""
+Records the frames drawn on the emulated LED matrix to a compact trace, and
+renders traces to images without requiring a display (or GTK).
+
+Recording reads every frame committed to the LED matrix, with the time it was
+committed, from the log of recent commits the emulator keeps (see
+:class:`~sense_emu.screen.CommitLog`), so even frames replaced before the
+recorder could read the LED matrix are recorded.
+
+A trace consists of a :data:`TRACE_HEADER` followed by one record per frame.
+Each record is a :data:`TRACE_REC` holding the frame's timestamp, flags, and a
+64-bit mask of the pixels that changed since the prior frame. This is followed
+by the new RGB565 values of the changed pixels (in row-major order), then the
+32-byte gamma table if the :data:`TRACE_GAMMA` flag is set (which it is
+whenever the gamma table changed). The first record therefore contains every
+pixel, and the gamma table.
+"""
+
+import os
+import warnings
+from struct import Struct
+from time import time
+from threading import Thread, Event
+from collections import namedtuple
+
+import numpy as np
+
+from .screen import ScreenClient, display_lut
+
+
+TRACE_HEADER = Struct(
+    '='  # native order, standard sizing
+    '8s' # magic number ("SENSESCR")
+    'B'  # version number (1)
+    '7x' # padding
+    'd'  # initial timestamp
+)
+
+TRACE_REC = Struct(
+    '='  # native order, standard sizing
+    'd'  # timestamp
+    'B'  # flags (TRACE_GAMMA)
+    'Q'  # mask of changed pixels (bit n is pixel n in row-major order)
+)
+
+TRACE_MAGIC = b'SENSESCR'
+TRACE_VERSION = 1
+TRACE_GAMMA = 1
+
+ScreenFrame = namedtuple('ScreenFrame', ('timestamp', 'screen', 'gamma'))
+
+
+class ScreenTraceWriter:
+    """
+    Writes a screen trace to the binary file-like object *output*. Call
+    :meth:`write` with every frame; frames identical to their predecessor
+    are not written.
+    """
+    def __init__(self, output, timestamp=None):
+        if timestamp is None:
+            timestamp = time()
+        self._output = output
+        self._screen = None
+        self._gamma = None
+        self._output.write(TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, timestamp))
+
+    def write(self, timestamp, screen, gamma):
+        """
+        Write a record for the frame *screen* (an 8 x 8 array of RGB565
+        values) with the 32-element *gamma* table, drawn at *timestamp*.
+        Returns ``False`` if nothing changed since the prior frame (in which
+        case nothing is written), and ``True`` otherwise.
+        """
+        screen = np.asarray(screen, dtype=np.uint16).reshape(64)
+        gamma = np.asarray(gamma, dtype=np.uint8)
+        if self._screen is None:
+            changed = np.ones(64, dtype=bool)
+        else:
+            changed = screen != self._screen
+        flags = 0
+        if self._gamma is None or not np.array_equal(gamma, self._gamma):
+            flags |= TRACE_GAMMA
+        if not flags and not changed.any():
+            return False
+        mask = int.from_bytes(
+            np.packbits(changed, bitorder='little').tobytes(), 'little')
+        self._output.write(TRACE_REC.pack(timestamp, flags, mask))
+        self._output.write(screen[changed].tobytes())
+        if flags & TRACE_GAMMA:
+            self._output.write(gamma.tobytes())
+        self._screen = screen.copy()
+        self._gamma = gamma.copy()
+        return True
+
+
+def read_trace(f):
+    """
+    Generator which reads the screen trace from the binary file-like object
+    *f*, yielding a :class:`ScreenFrame` tuple of (timestamp, screen, gamma)
+    for each frame, where *screen* is an 8 x 8 array of RGB565 values, and
+    *gamma* is a 32-element array.
+    """
+    buf = f.read(TRACE_HEADER.size)
+    if len(buf) < TRACE_HEADER.size:
+        raise IOError('Incomplete header at start of trace')
+    magic, ver, offset = TRACE_HEADER.unpack(buf)
+    if magic != TRACE_MAGIC:
+        raise IOError('Invalid magic number at start of trace')
+    if ver != TRACE_VERSION:
+        raise IOError('Unrecognized trace version number (%d)' % ver)
+    screen = np.zeros(64, dtype=np.uint16)
+    gamma = np.zeros(32, dtype=np.uint8)
+    while True:
+        buf = f.read(TRACE_REC.size)
+        if not buf:
+            break
+        elif len(buf) < TRACE_REC.size:
+            raise IOError('Incomplete frame record at end of trace')
+        timestamp, flags, mask = TRACE_REC.unpack(buf)
+        changed = np.unpackbits(
+            np.frombuffer(mask.to_bytes(8, 'little'), dtype=np.uint8),
+            bitorder='little').astype(bool)
+        size = int(changed.sum()) * 2
+        if flags & TRACE_GAMMA:
+            size += 32
+        buf = f.read(size)
+        if len(buf) < size:
+            raise IOError('Incomplete frame record at end of trace')
+        values = np.frombuffer(buf, dtype=np.uint16, count=int(changed.sum()))
+        screen[changed] = values
+        if flags & TRACE_GAMMA:
+            gamma = np.frombuffer(buf, dtype=np.uint8, offset=values.nbytes)
+        yield ScreenFrame(timestamp, screen.reshape((8, 8)).copy(), gamma.copy())
+
+
+def load_trace(f):
+    """
+    Reads the whole screen trace from the binary file-like object *f*,
+    returning a :class:`ScreenFrame` tuple of arrays: *timestamp* has the
+    shape (N,), *screen* the shape (N, 8, 8), and *gamma* the shape (N, 32).
+    """
+    frames = list(read_trace(f))
+    return ScreenFrame(
+        np.array([frame.timestamp for frame in frames], dtype=float),
+        np.array([frame.screen for frame in frames], dtype=np.uint16).reshape((-1, 8, 8)),
+        np.array([frame.gamma for frame in frames], dtype=np.uint8).reshape((-1, 32)),
+    )
+
+
+def render_frames(screens, gammas, scale=1):
+    """
+    Converts the (N, 8, 8) array of RGB565 *screens*, and the corresponding
+    (N, 32) array of *gammas* (as returned by :func:`load_trace`) to the
+    colours displayed by the emulator, returning an (N, 8 * *scale*,
+    8 * *scale*, 3) array of R,G,B values with each LED scaled up to a
+    *scale* x *scale* block of pixels.
+    """
+    screens = np.asarray(screens, dtype=np.uint16)
+    gammas = np.asarray(gammas, dtype=np.uint8)
+    if scale < 1:
+        raise ValueError('scale must be 1 or more')
+    rgb = np.empty(screens.shape + (3,), dtype=np.uint8)
+    # Gamma tables rarely change, so map all frames sharing a gamma table in
+    # one go
+    tables, index = np.unique(gammas, axis=0, return_inverse=True)
+    index = index.reshape(-1)
+    for i, table in enumerate(tables):
+        frames = index == i
+        rgb[frames] = display_lut(table)[screens[frames]]
+    n = screens.shape[0]
+    return np.broadcast_to(
+        rgb[:, :, np.newaxis, :, np.newaxis, :],
+        (n, 8, scale, 8, scale, 3)).reshape((n, 8 * scale, 8 * scale, 3))
+
+
+def render_sheets(images, columns=8, rows=8):
+    """
+    Tiles the (N, height, width, 3) array of *images* (as returned by
+    :func:`render_frames`) into sheets of *columns* x *rows* images, returning
+    an (S, rows * height, columns * width, 3) array of the sheets. Unused
+    positions on the last sheet are black.
+    """
+    images = np.asarray(images, dtype=np.uint8)
+    if columns < 1 or rows < 1:
+        raise ValueError('columns and rows must be 1 or more')
+    n, height, width = images.shape[:3]
+    per_sheet = columns * rows
+    sheets = max(1, -(-n // per_sheet))
+    tiles = np.zeros((sheets * per_sheet, height, width, 3), dtype=np.uint8)
+    tiles[:n] = images
+    return tiles.reshape((sheets, rows, columns, height, width, 3)).transpose(
+        (0, 1, 3, 2, 4, 5)).reshape((sheets, rows * height, columns * width, 3))
+
+
+def save_png_sheets(filename, images, columns=8, rows=8):
+    """
+    Writes the *images* to PNG sheets of *columns* x *rows* images (see
+    :func:`render_sheets`). If there is more than one sheet, a three digit
+    sheet number is added to the end of each *filename*. Returns the list of
+    filenames written.
+    """
+    from PIL import Image
+
+    sheets = render_sheets(images, columns, rows)
+    if len(sheets) == 1:
+        filenames = [filename]
+    else:
+        base, ext = os.path.splitext(filename)
+        filenames = ['%s-%03d%s' % (base, i, ext) for i in range(len(sheets))]
+    for name, sheet in zip(filenames, sheets):
+        Image.fromarray(sheet).save(name, format='PNG')
+    return filenames
+
+
+def save_gif(filename, timestamps, images):
+    """
+    Writes the *images* to an animated GIF, showing each for the time between
+    its timestamp and the next in *timestamps* (the last image is shown for
+    one second).
+    """
+    from PIL import Image
+
+    images = np.asarray(images, dtype=np.uint8)
+    if not len(images):
+        raise ValueError('no frames to write')
+    # GIF frame delays are measured in hundredths of a second
+    durations = np.diff(np.append(timestamps, timestamps[-1] + 1)) * 1000
+    durations = np.maximum(10, np.round(durations, -1)).astype(int).tolist()
+    frames = [Image.fromarray(image) for image in images]
+    frames[0].save(
+        filename, format='GIF', save_all=True, append_images=frames[1:],
+        duration=durations, loop=0)
+
+
+class ScreenRecorder:
+    """
+    Records the frames committed to the emulated LED matrix to the binary
+    file-like object *output* as a screen trace, from a background thread,
+    until :meth:`close` is called.
+
+    Every frame committed is recorded, with the time it was committed,
+    including those replaced before the recorder could read the LED matrix
+    (for example, during a burst of :meth:`~sense_emu.SenseHat.set_pixel`
+    calls). This relies on the log of recent commits the emulator keeps (see
+    :class:`~sense_emu.screen.CommitLog`); writers wait for the recorder
+    rather than overwrite commits it hasn't read. Only if the recorder stops
+    reading for longer than :attr:`~sense_emu.screen.CommitLog.timeout` are
+    frames lost; these are counted in :attr:`missed`, and a warning is issued
+    by :meth:`close`.
+
+    The *instance* parameter names the emulator instance to record; if it is
+    ``None`` (the default), the value of the ``SENSE_EMU_INSTANCE``
+    environment variable is used, as for :class:`~sense_emu.SenseHat`.
+    """
+    def __init__(self, output, instance=None):
+        self._client = ScreenClient(instance, record=True)
+        self._writer = ScreenTraceWriter(output)
+        self._frames = 0
+        self._missed = 0
+        self._error = None
+        self._stop = Event()
+        self._thread = Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._client:
+            self._stop.set()
+            self._client.wake()
+            self._thread.join()
+            self._client.close()
+            self._client = None
+            if self._error:
+                raise self._error
+            if self._missed:
+                warnings.warn(Warning(
+                    '%d frames were committed too quickly to record' %
+                    self._missed))
+
+    def _run(self):
+        try:
+            # The first frame is the LED matrix as it is when recording
+            # starts; after that, every commit is recorded as it was made
+            sequence, screen, gamma = self._client.read()
+            if self._writer.write(time(), screen, gamma):
+                self._frames += 1
+            while not self._stop.is_set():
+                if self._client.wait(sequence):
+                    sequence, commits, missed = self._client.commits(sequence)
+                    self._missed += missed
+                    for commit in commits:
+                        if self._writer.write(
+                                commit.timestamp, commit.screen, commit.gamma):
+                            self._frames += 1
+        except Exception as e:
+            self._error = e
+
+    @property
+    def frames(self):
+        """
+        The number of frames recorded so far.
+        """
+        return self._frames
+
+    @property
+    def missed(self):
+        """
+        The number of frames committed while the recorder was so far behind
+        that they were no longer in the emulator's log of commits, and which
+        were therefore not recorded (each commit advances the screen's sequence
+        number, so the recorder can tell how many it didn't see).
+        """
+        return self._missed
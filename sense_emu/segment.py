@@ -0,0 +1,337 @@
+# vim: set et sw=4 sts=4 fileencoding=utf-8:
+#
+# Raspberry Pi Sense HAT Emulator library for the Raspberry Pi
+# Copyright (c) 2016 Raspberry Pi Foundation <info@raspberrypi.org>
+#
+# This package is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2.1 of the License, or (at your option)
+# any later version.
+#
+# This package is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>
+
+import os
+import io
+import mmap
+from time import time
+from struct import Struct
+from functools import lru_cache
+from collections import namedtuple
+
+from .common import (
+    SeqLock, SEQUENCE, INSTANCE_NAME, instance_name, shared_dir,
+    shared_filename)
+from .lock import pid_exists
+from .scheduler import scheduler
+
+
+# The state of all the emulated devices is held in a single shared segment
+# (a file in /dev/shm, mapped by every process using the emulator). It starts
+# with a header identifying the layout and the process writing the devices'
+# registers, followed by a table with an entry for each device, followed by
+# the devices' registers themselves
+SEGMENT_HEADER = Struct(
+    '='  # native order, standard sizing
+    '8s' # magic number ("SENSEEMU")
+    'B'  # layout version number (2)
+    'B'  # number of devices
+    '2x' # padding
+    'I'  # count of changes to the clients' sockets
+    'q'  # PID of the writer (0 if there is none)
+    'd'  # time of the writer's last heartbeat
+)
+
+# Each device's entry holds the offset and size of its registers, and the
+# sequence number protecting them (see SeqLock)
+SEGMENT_DEVICE = Struct(
+    '='  # native order, standard sizing
+    '8s' # device name
+    'I'  # offset of the device's registers
+    'I'  # size of the device's registers
+    'Q'  # update sequence number
+)
+
+SEGMENT_MAGIC = b'SENSEEMU'
+SEGMENT_VERSION = 2
+
+# The writer's fields of SEGMENT_HEADER (which are at the end of it), which
+# are written in place by the writer's heartbeat
+SEGMENT_WRITER = Struct(
+    '='  # native order, standard sizing
+    'q'  # PID of the writer
+    'd'  # time of the writer's last heartbeat
+)
+WRITER_OFFSET = SEGMENT_HEADER.size - SEGMENT_WRITER.size
+
+# The count of changes to the clients' sockets (the field of SEGMENT_HEADER
+# preceding the writer's), which is incremented by clients in place
+SEGMENT_CLIENTS = Struct('=I')
+CLIENTS_OFFSET = WRITER_OFFSET - SEGMENT_CLIENTS.size
+DEVICE_SEQUENCE_OFFSET = SEGMENT_DEVICE.size - SEQUENCE.size
+
+# Each device's registers are aligned to a cache line so an update of one
+# device doesn't disturb readers of another
+SEGMENT_ALIGN = 64
+
+# The interval (in seconds) at which the writer updates its heartbeat, and the
+# time after which a writer that hasn't is considered dead
+WRITER_INTERVAL = 1
+WRITER_TIMEOUT = 5
+
+SegmentDevice = namedtuple('SegmentDevice', ('name', 'offset', 'size', 'init'))
+
+
+def segment_filename(instance=None):
+    """
+    Return the filename used to represent the state of the emulated sense HAT
+    of the emulator *instance* (see
+    :func:`~sense_emu.common.shared_filename`).
+    """
+    return shared_filename('', instance)
+
+
+def writer_alive(pid, heartbeat):
+    """
+    Return ``True`` if the writer *pid*, which last updated its *heartbeat*
+    at that time, is still alive.
+    """
+    return bool(pid) and time() - heartbeat < WRITER_TIMEOUT and pid_exists(pid)
+
+
+def segment_devices():
+    """
+    Return the layout of the devices in the segment as a sequence of
+    :class:`SegmentDevice` tuples. Each device's *init* is called with a
+    zeroed view of its registers when the segment is created, or ``None`` if
+    zeros are reasonable initial values.
+
+    This is the one place to add a new device (and increment
+    :data:`SEGMENT_VERSION`).
+    """
+    # The device modules depend on this one, hence importing them here
+    from .screen import SCREEN_SIZE, init_screen
+    from .imu import IMU_SIZE
+    from .pressure import PRESSURE_SIZE
+    from .humidity import HUMIDITY_SIZE
+
+    devices = (
+        ('screen', SCREEN_SIZE, init_screen),
+        ('imu', IMU_SIZE, None),
+        ('pressure', PRESSURE_SIZE, None),
+        ('humidity', HUMIDITY_SIZE, None),
+        )
+    result = []
+    offset = SEGMENT_HEADER.size + SEGMENT_DEVICE.size * len(devices)
+    for name, size, init in devices:
+        offset = (offset + SEGMENT_ALIGN - 1) // SEGMENT_ALIGN * SEGMENT_ALIGN
+        result.append(SegmentDevice(name, offset, size, init))
+        offset += size
+    return result
+
+
+class Segment:
+    """
+    The shared segment holding the registers of all the emulated devices,
+    backed by *filename*. Use :func:`open_segment` rather than constructing
+    this directly, so each process maps the segment only once.
+
+    If the file already exists with the expected layout it is used as is. If
+    the file does not already exist, or was created by an incompatible
+    version, it is (re-)created with reasonable initial values.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self._table = segment_devices()
+        self._devices = {device.name: device for device in self._table}
+        last = self._table[-1]
+        self.size = last.offset + last.size
+        # The file is opened without truncation so that a process creating
+        # the segment can't pull it out from under another that's mapped it
+        fd = io.open(
+            os.open(filename, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o666),
+            'r+b', buffering=0)
+        try:
+            if not self._valid(fd.read(self.size)):
+                self._initialize(fd)
+            self.map = mmap.mmap(fd.fileno(), self.size, access=mmap.ACCESS_WRITE)
+        finally:
+            # The mapping remains valid after the file is closed
+            fd.close()
+        self._heartbeat_job = None
+
+    def _layout(self):
+        header = SEGMENT_HEADER.pack(
+            SEGMENT_MAGIC, SEGMENT_VERSION, len(self._table), 0, 0, 0.0)
+        table = b''.join(
+            SEGMENT_DEVICE.pack(
+                device.name.encode('ascii'), device.offset, device.size, 0)
+            for device in self._table
+            )
+        return header + table
+
+    def _valid(self, data):
+        # Returns True if data (the content of the file) has our layout; the
+        # clients' count, the writer and the sequence numbers are ignored as
+        # they vary
+        if len(data) != self.size:
+            return False
+        layout = bytearray(self._layout())
+        writer = slice(CLIENTS_OFFSET, SEGMENT_HEADER.size)
+        layout[writer] = data[writer]
+        for device in self._table:
+            offset = self.sequence_offset(device.name)
+            sequence = slice(offset, offset + SEQUENCE.size)
+            layout[sequence] = data[sequence]
+        return data[:len(layout)] == layout
+
+    def _initialize(self, fd):
+        data = bytearray(self.size)
+        layout = self._layout()
+        data[:len(layout)] = layout
+        for device in self._table:
+            if device.init is not None:
+                device.init(memoryview(data)[device.offset:device.offset + device.size])
+        fd.seek(0)
+        fd.write(data)
+        fd.truncate()
+
+    def region(self, name):
+        """
+        Return a :class:`memoryview` of the registers of the device *name*.
+        """
+        device = self._devices[name]
+        return memoryview(self.map)[device.offset:device.offset + device.size]
+
+    def sequence_offset(self, name):
+        """
+        Return the offset (in :attr:`map`) of the sequence number protecting
+        the registers of the device *name*.
+        """
+        index = self._table.index(self._devices[name])
+        return (
+            SEGMENT_HEADER.size + index * SEGMENT_DEVICE.size +
+            DEVICE_SEQUENCE_OFFSET)
+
+    def seqlock(self, name):
+        """
+        Return a :class:`~sense_emu.common.SeqLock` for reading and writing
+        the registers of the device *name* (at offsets relative to the start
+        of its registers). Reads only give up on waiting for a consistent
+        view of the registers if :attr:`writer` is dead.
+        """
+        return SeqLock(
+            self.map, self.sequence_offset(name), self.region(name),
+            alive=lambda: self.writer is not None)
+
+    @property
+    def clients(self):
+        """
+        A count which changes whenever a client of the emulator (such as a
+        :class:`~sense_emu.screen.ScreenClient`) binds or removes a socket in
+        the shared directory; writers can compare it with a prior value to
+        determine cheaply whether they need to look for clients again.
+        """
+        return SEGMENT_CLIENTS.unpack_from(self.map, CLIENTS_OFFSET)[0]
+
+    def clients_changed(self):
+        """
+        Change :attr:`clients`; called by clients after binding or removing
+        their sockets.
+        """
+        # This isn't atomic, but as clients change their sockets before the
+        # count, a writer that sees any change will find every socket changed
+        # before it
+        SEGMENT_CLIENTS.pack_into(
+            self.map, CLIENTS_OFFSET, (self.clients + 1) & 0xFFFFFFFF)
+
+    @property
+    def writer(self):
+        """
+        The PID of the process writing the devices' registers, or ``None`` if
+        no live process is doing so.
+        """
+        pid, heartbeat = SEGMENT_WRITER.unpack_from(self.map, WRITER_OFFSET)
+        if writer_alive(pid, heartbeat):
+            return pid
+        return None
+
+    def start_writer(self):
+        """
+        Record the current process as the writer of the devices' registers,
+        and periodically update its heartbeat until :meth:`stop_writer` is
+        called. This is expected to be called by whatever holds the emulator
+        lock (see :class:`~sense_emu.lock.EmulatorLock`).
+        """
+        if not self._heartbeat_job:
+            self._heartbeat()
+            self._heartbeat_job = scheduler.add(WRITER_INTERVAL, self._heartbeat)
+
+    def stop_writer(self):
+        """
+        Stop updating the heartbeat of the current process, and clear the
+        writer if it is the current process.
+        """
+        if self._heartbeat_job:
+            self._heartbeat_job.cancel()
+            self._heartbeat_job = None
+            if SEGMENT_WRITER.unpack_from(self.map, WRITER_OFFSET)[0] == os.getpid():
+                SEGMENT_WRITER.pack_into(self.map, WRITER_OFFSET, 0, 0.0)
+
+    def _heartbeat(self):
+        SEGMENT_WRITER.pack_into(self.map, WRITER_OFFSET, os.getpid(), time())
+
+
+def open_segment(instance=None):
+    """
+    Return the :class:`Segment` holding the state of the emulated sense HAT of
+    the emulator *instance* (see :func:`~sense_emu.common.instance_name`),
+    creating it if necessary. Each segment is only mapped once per process.
+    """
+    return _open_segment(instance_name(instance))
+
+
+@lru_cache()
+def _open_segment(instance):
+    return Segment(segment_filename(instance))
+
+
+def live_instances():
+    """
+    Return a sorted list of the names of the emulator instances on this host
+    which currently have a live emulator (such as sense_emu_gui) driving
+    them. The default instance is named ``''``. Any of these names may be
+    passed as the *instance* of :class:`~sense_emu.SenseHat` (or set as the
+    ``SENSE_EMU_INSTANCE`` environment variable).
+    """
+    default = os.path.basename(segment_filename(''))
+    result = []
+    for fname in os.listdir(shared_dir()):
+        if fname == default:
+            instance = ''
+        elif fname.startswith(default + '@'):
+            instance = fname[len(default) + 1:]
+            # Skip the other files and sockets of named instances
+            if not instance or not INSTANCE_NAME.match(instance):
+                continue
+        else:
+            continue
+        # Just read the header; opening the segment would create (or
+        # re-initialize) it
+        try:
+            with io.open(os.path.join(shared_dir(), fname), 'rb') as f:
+                header = f.read(SEGMENT_HEADER.size)
+        except IOError:
+            continue
+        if len(header) == SEGMENT_HEADER.size:
+            magic, version, count, clients, pid, heartbeat = SEGMENT_HEADER.unpack(header)
+            if (
+                    (magic, version) == (SEGMENT_MAGIC, SEGMENT_VERSION) and
+                    writer_alive(pid, heartbeat)):
+                result.append(instance)
+    return sorted(result)
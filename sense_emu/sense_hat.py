@@ -16,27 +16,57 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>
 
-import struct
 import io
 import os
 import sys
 import math
 import time
+import numbers
+import errno
 import numpy as np
 import shutil
 import glob
-import array
-import struct
 import subprocess as sp
 import warnings
-from PIL import Image  # pillow
+from PIL import Image, ImageSequence  # pillow
 from copy import deepcopy
+from itertools import cycle
+from contextlib import contextmanager
+from functools import lru_cache
+from threading import Lock, RLock, local
 
 
 from . import RTIMU
 from .lock import EmulatorLock
 from .stick import SenseStick
-from .screen import init_screen, GAMMA_DEFAULT, GAMMA_LOW
+from .animation import FramePlayer
+from .common import instance_name, INSTANCE_ENV
+from .segment import open_segment
+from .screen import (
+    pack_rgb565,
+    ScreenNotifier,
+    CommitLog,
+    PIXELS_OFFSET,
+    GAMMA_OFFSET,
+    unpack_rgb565,
+    GAMMA_DEFAULT,
+    GAMMA_LOW,
+    )
+
+
+# The frame-buffer's sequence number permits only one writer at a time, so
+# every SenseHat in the process writing to the same segment shares a lock
+_fb_locks = {}
+_fb_locks_lock = Lock()
+
+
+def _fb_write_lock(segment):
+    """
+    Internal. Returns the lock serializing writes to the frame-buffer in
+    *segment*.
+    """
+    with _fb_locks_lock:
+        return _fb_locks.setdefault(segment, RLock())
 
 
 class SenseHat:
@@ -58,6 +88,19 @@ class SenseHat:
     The *text_assets* parameter provides the base name of the PNG image and
     text file which will be used to define the font used by the
     :meth:`show_message` method.
+
+    The *instance* parameter names the emulator instance to use, permitting
+    several emulators (each with their own sense HAT) to run on one machine.
+    If it is ``None`` (the default), the value of the ``SENSE_EMU_INSTANCE``
+    environment variable is used, and if that isn't set the default instance
+    (named ``''``) is used. The names of the instances with a running emulator
+    are returned by :func:`live_instances`.
+
+    Any number of instances of this class may write to the LED matrix from
+    threads within one process. However, writing to the LED matrix of an
+    emulator instance from several processes at once is not supported (much
+    as with the real HAT's frame-buffer, the result will be a mixture of the
+    processes' frames, which may be seen part way through being written).
     """
 
     SENSE_HAT_FB_NAME = 'RPi-Sense FB'
@@ -72,10 +115,12 @@ class SenseHat:
     def __init__(
             self,
             imu_settings_file='RTIMULib',
-            text_assets='sense_hat_text'
+            text_assets='sense_hat_text',
+            instance=None
         ):
 
-        lock = EmulatorLock('sense_emu')
+        self._instance = instance_name(instance)
+        lock = EmulatorLock('sense_emu', self._instance)
         if not lock.wait(1):
             warnings.warn(Warning('No emulator detected; spawning sense_emu_gui'))
             try:
@@ -85,14 +130,36 @@ class SenseHat:
             # setpgrp is called to spawn a new process group, ensuring that
             # signals from the interpreter (e.g. the user pressing Ctrl+C)
             # don't get sent to the emulator too
+            # The emulator is told which instance to emulate by its
+            # environment
+            env = os.environ.copy()
+            env[INSTANCE_ENV] = self._instance
             sp.Popen(
-                ['sense_emu_gui'], preexec_fn=setpgrp,
+                ['sense_emu_gui'], preexec_fn=setpgrp, env=env,
                 stdin=sp.DEVNULL, stdout=sp.DEVNULL, stderr=sp.DEVNULL,
                 close_fds=True)
 
-        self._fb_device = self._get_fb_device()
-        if self._fb_device is None:
+        self._fb_segment = self._get_fb_device()
+        if self._fb_segment is None:
             raise OSError('Cannot detect %s device' % self.SENSE_HAT_FB_NAME)
+        self._fb_device = self._fb_segment.filename
+        # All pixel and gamma operations work on NumPy views of the screen's
+        # registers in the shared segment (which is mapped once per process)
+        # rather than seeking and reading / writing the underlying file
+        fb_registers = self._fb_segment.region('screen')
+        self._fb_lock = _fb_write_lock(self._fb_segment)
+        self._fb_notifier = ScreenNotifier(self._instance)
+        self._fb_sequence = np.frombuffer(
+            self._fb_segment.map, dtype=np.uint64, count=1,
+            offset=self._fb_segment.sequence_offset('screen'))
+        self._fb = np.frombuffer(
+            fb_registers, dtype=np.uint16, count=64,
+            offset=PIXELS_OFFSET).reshape((8, 8))
+        self._fb_gamma = np.frombuffer(
+            fb_registers, dtype=np.uint8, count=32, offset=GAMMA_OFFSET)
+        self._fb_log = CommitLog(fb_registers)
+        # Holds the shadow frame of each thread inside batch()
+        self._fb_batch = local()
 
         # 0 is With B+ HDMI port facing downwards
         pix_map0 = np.array([
@@ -118,6 +185,8 @@ class SenseHat:
         }
 
         self._rotation = 0
+        self._player = None
+        self._image_cache = lru_cache(maxsize=32)(self._decode_image)
 
         # Load text assets
         dir_path = os.path.dirname(__file__)
@@ -128,11 +197,11 @@ class SenseHat:
 
         # Load IMU settings and calibration data
         self._imu_settings = self._get_settings_file(imu_settings_file)
-        self._imu = RTIMU.RTIMU(self._imu_settings)
+        self._imu = RTIMU.RTIMU(self._imu_settings, self._instance)
         self._imu_init = False  # Will be initialised as and when needed
-        self._pressure = RTIMU.RTPressure(self._imu_settings)
+        self._pressure = RTIMU.RTPressure(self._imu_settings, self._instance)
         self._pressure_init = False  # Will be initialised as and when needed
-        self._humidity = RTIMU.RTHumidity(self._imu_settings)
+        self._humidity = RTIMU.RTHumidity(self._imu_settings, self._instance)
         self._humidity_init = False  # Will be initialised as and when needed
         self._last_orientation = {'pitch': 0, 'roll': 0, 'yaw': 0}
         raw = {'x': 0, 'y': 0, 'z': 0}
@@ -142,7 +211,7 @@ class SenseHat:
         self._compass_enabled = False
         self._gyro_enabled = False
         self._accel_enabled = False
-        self._stick = SenseStick()
+        self._stick = SenseStick(self._instance)
 
     ####
     # Text assets
@@ -151,24 +220,25 @@ class SenseHat:
     # Text asset files are rotated right through 90 degrees to allow blocks of
     # 40 contiguous pixels to represent one 5 x 8 character. These are stored
     # in a 8 x 640 pixel png image with characters arranged adjacently
-    # Consequently we must rotate the pixel map left through 90 degrees to
-    # compensate when drawing text
+    # Consequently we must rotate rendered text left through 90 degrees to
+    # compensate when drawing it
 
     def _load_text_assets(self, text_image_file, text_file):
         """
-        Internal. Builds a character indexed dictionary of pixels used by the
-        show_message function below
+        Internal. Builds a character indexed dictionary of 5 x 8 boolean masks
+        (lit pixels are white in the image) used by the show_message function
+        below
         """
 
-        text_pixels = self.load_image(text_image_file, False)
+        text_pixels = np.array(
+            self.load_image(text_image_file, False), dtype=np.uint8)
+        text_masks = (text_pixels == 255).all(axis=1).reshape((-1, 5, 8))
         with open(text_file, 'r') as f:
             loaded_text = f.read()
         self._text_dict = {}
         for index, s in enumerate(loaded_text):
-            start = index * 40
-            end = start + 40
-            char = text_pixels[start:end]
-            self._text_dict[s] = char
+            self._text_dict[s] = text_masks[index]
+        self._text_cache = lru_cache(maxsize=64)(self._render_text)
 
     def _trim_whitespace(self, char):  # For loading text assets only
         """
@@ -176,20 +246,9 @@ class SenseHat:
         text characters
         """
 
-        psum = lambda x: sum(sum(x, []))
-        if psum(char) > 0:
-            is_empty = True
-            while is_empty:  # From front
-                row = char[0:8]
-                is_empty = psum(row) == 0
-                if is_empty:
-                    del char[0:8]
-            is_empty = True
-            while is_empty:  # From back
-                row = char[-8:]
-                is_empty = psum(row) == 0
-                if is_empty:
-                    del char[-8:]
+        lit = char.any(axis=1).nonzero()[0]
+        if len(lit):
+            return char[lit[0]:lit[-1] + 1]
         return char
 
     def _get_settings_file(self, imu_settings_file):
@@ -217,13 +276,10 @@ class SenseHat:
 
     def _get_fb_device(self):
         """
-        Internal. Finds the correct frame buffer device for the sense HAT
-        and returns its /dev name.
+        Internal. Finds the shared segment holding the sense HAT's frame
+        buffer and returns it.
         """
-        fd = init_screen()
-        result = fd.name
-        fd.close()
-        return result
+        return open_segment(self._instance)
 
     ####
     # Joystick
@@ -240,6 +296,31 @@ class SenseHat:
     # LED Matrix
     ####
 
+    @property
+    def framebuffer(self):
+        """
+        An 8x8 :class:`numpy.ndarray` of 16-bit RGB565 values which is a
+        direct (zero-copy) view of the LED matrix's frame-buffer. The array is
+        indexed by row, then column, and ignores :attr:`rotation`. Writing to
+        the array immediately updates the LED matrix's memory, though the
+        emulator will not display the change until the next frame is written
+        by a method like :meth:`set_pixels`.
+
+        Within :meth:`batch`, this is the calling thread's in-memory shadow of
+        the frame-buffer instead, which is committed when the batch ends.
+        """
+        return self._frame
+
+    @property
+    def _frame(self):
+        """
+        Internal. The 8 x 8 array of RGB565 values that drawing in the calling
+        thread currently targets: the shadow frame inside :meth:`batch`, or the
+        frame-buffer itself
+        """
+        shadow = getattr(self._fb_batch, 'shadow', None)
+        return self._fb if shadow is None else shadow
+
     @property
     def rotation(self):
         return self._rotation
@@ -255,11 +336,14 @@ class SenseHat:
         """
 
         if r in self._pix_map.keys():
-            if redraw:
-                pixel_list = self.get_pixels()
-            self._rotation = r
-            if redraw:
-                self.set_pixels(pixel_list)
+            # Hold the frame-buffer lock so background drawing (e.g. a
+            # scrolling message) can't interleave with the redraw
+            with self._fb_lock:
+                if redraw:
+                    packed = self._read_frame()
+                self._rotation = r
+                if redraw:
+                    self._write_frame(packed)
         else:
             raise ValueError('Rotation must be 0, 90, 180 or 270 degrees')
 
@@ -271,48 +355,186 @@ class SenseHat:
         r = (pix[0] >> 3) & 0x1F
         g = (pix[1] >> 2) & 0x3F
         b = (pix[2] >> 3) & 0x1F
-        bits16 = (r << 11) + (g << 5) + b
-        return struct.pack('H', bits16)
+        return (r << 11) + (g << 5) + b
 
-    def _unpack_bin(self, packed):
+    def _unpack_bin(self, bits16):
         """
         Internal. Decodes 16 bit RGB565 into python list [R,G,B]
         """
 
-        output = struct.unpack('H', packed)
-        bits16 = output[0]
+        bits16 = int(bits16)
         r = (bits16 & 0xF800) >> 11
         g = (bits16 & 0x7E0) >> 5
         b = (bits16 & 0x1F)
         return [int(r << 3), int(g << 2), int(b << 3)]
 
+    def _check_pixels(self, pixel_list):
+        """
+        Internal. Validates a sequence of ``[R,G,B]`` pixels, returning them
+        as an N x 3 array
+        """
+
+        try:
+            pixels = np.array(pixel_list)
+        except ValueError:
+            # Ragged sequences can't be converted; the loop below will find
+            # the offending pixel
+            pixels = None
+        if (
+                pixels is None or pixels.ndim != 2 or pixels.shape[1] != 3 or
+                pixels.dtype.kind not in 'biu'):
+            # Something's wrong; find the offending pixel with the checks
+            # (and errors) of the original per-pixel implementation
+            for index, pix in enumerate(pixel_list):
+                if len(pix) != 3:
+                    raise ValueError('Pixel at index %d is invalid. Pixels must contain 3 elements: Red, Green and Blue' % index)
+            for index, pix in enumerate(pixel_list):
+                if not all(isinstance(element, numbers.Integral) for element in pix):
+                    raise TypeError('Pixel at index %d is invalid. Pixel elements must be integers' % index)
+            # Shouldn't get here, but just in case
+            raise ValueError('Pixels must be given as a sequence of [R,G,B] values')
+        invalid = ((pixels < 0) | (pixels > 255)).any(axis=1)
+        if invalid.any():
+            raise ValueError('Pixel at index %d is invalid. Pixel elements must be between 0 and 255' % invalid.argmax())
+        return pixels.astype(np.uint8)
+
+    def _pack_array(self, pixels):
+        """
+        Internal. Validates and converts an 8 x 8 x 3 array of pixels, or a
+        bytes-like object of 64 RGB565 values, into an 8 x 8 array of RGB565
+        values
+        """
+
+        if isinstance(pixels, (bytes, bytearray, memoryview)):
+            if len(memoryview(pixels).cast('B')) != 128:
+                raise ValueError('Raw pixel data must be 128 bytes long')
+            return np.frombuffer(pixels, dtype=np.uint16).reshape((8, 8))
+        pixels = np.asarray(pixels)
+        if pixels.shape != (8, 8, 3):
+            raise ValueError('Pixel arrays must have the shape (8, 8, 3)')
+        if pixels.dtype.kind not in 'biu':
+            raise TypeError('Pixel arrays must have an integer dtype')
+        if pixels.dtype != np.uint8:
+            if pixels.size and (pixels.min() < 0 or pixels.max() > 255):
+                raise ValueError('Pixel elements must be between 0 and 255')
+            pixels = pixels.astype(np.uint8)
+        return pack_rgb565(pixels)
+
+    def _read_frame(self):
+        """
+        Internal. Returns an 8 x 8 array of the RGB565 values currently
+        displayed on the LED matrix, as seen under the current rotation
+        """
+
+        return self._frame.reshape(64)[self._pix_map[self._rotation]]
+
+    @contextmanager
+    def _fb_update(self):
+        """
+        Internal. Wraps every write to the frame-buffer, making the sequence
+        number odd for the duration of the write and even (and different) when
+        it completes, so readers only ever observe complete frames. The new
+        frame is logged for recorders (after waiting for them to read the
+        entry it replaces) before it's completed, and viewers are notified of
+        it afterward
+        """
+
+        with self._fb_lock:
+            sequence = int(self._fb_sequence[0]) | 1
+            self._fb_log.reserve(sequence + 1)
+            self._fb_sequence[0] = sequence
+            try:
+                yield
+            finally:
+                self._fb_log.log(
+                    sequence + 1, time.time(), self._fb, self._fb_gamma)
+                self._fb_sequence[0] = sequence + 1
+                self._fb_notifier.notify()
+
+    @contextmanager
+    def _fb_draw(self):
+        """
+        Internal. Wraps every change to the displayed pixels, yielding the
+        8 x 8 array to draw on. Inside :meth:`batch` this is the calling
+        thread's shadow frame; otherwise it is the frame-buffer itself, within
+        :meth:`_fb_update`
+        """
+
+        shadow = getattr(self._fb_batch, 'shadow', None)
+        if shadow is not None:
+            yield shadow
+        else:
+            with self._fb_update():
+                yield self._fb
+
+    @contextmanager
+    def batch(self):
+        """
+        Returns a context manager which batches drawing on the LED matrix.
+        Within the ``with`` block, methods like :meth:`set_pixel`,
+        :meth:`set_pixels`, :meth:`clear` and :meth:`flip_h` draw on an
+        in-memory copy of the display (and methods like :meth:`get_pixels`
+        read from it). When the block ends, the pixels that changed are written
+        to the LED matrix in a single update, or nothing is written if no
+        pixels changed. For example::
+
+            with hat.batch():
+                hat.clear()
+                for x, y in sprite:
+                    hat.set_pixel(x, y, 255, 0, 0)
+
+        Batches apply only to drawing from the calling thread, and nested
+        batches are merged into the outermost. If the block raises an
+        exception, everything drawn within it is discarded, and the LED
+        matrix is left unchanged.
+        """
+
+        if getattr(self._fb_batch, 'shadow', None) is not None:
+            yield
+            return
+        with self._fb_lock:
+            start = self._fb.copy()
+        self._fb_batch.shadow = start.copy()
+        try:
+            yield
+        finally:
+            shadow = self._fb_batch.shadow
+            self._fb_batch.shadow = None
+        # Only pixels drawn in the batch are written so that concurrent
+        # changes to other pixels aren't overwritten
+        changed = shadow != start
+        if changed.any():
+            with self._fb_update():
+                self._fb[changed] = shadow[changed]
+
+    def _write_frame(self, packed):
+        """
+        Internal. Writes an 8 x 8 array of RGB565 values to the LED matrix,
+        accounting for the current rotation
+        """
+
+        with self._fb_draw() as frame:
+            frame.reshape(64)[self._pix_map[self._rotation]] = packed
+
     def flip_h(self, redraw=True):
         """
         Flip LED matrix horizontal
         """
 
-        pixel_list = self.get_pixels()
-        flipped = []
-        for i in range(8):
-            offset = i * 8
-            flipped.extend(reversed(pixel_list[offset:offset + 8]))
+        flipped = self._read_frame()[:, ::-1]
         if redraw:
-            self.set_pixels(flipped)
-        return flipped
+            self._write_frame(flipped)
+        return unpack_rgb565(flipped).reshape((64, 3)).tolist()
 
     def flip_v(self, redraw=True):
         """
         Flip LED matrix vertical
         """
 
-        pixel_list = self.get_pixels()
-        flipped = []
-        for i in reversed(range(8)):
-            offset = i * 8
-            flipped.extend(pixel_list[offset:offset + 8])
+        flipped = self._read_frame()[::-1, :]
         if redraw:
-            self.set_pixels(flipped)
-        return flipped
+            self._write_frame(flipped)
+        return unpack_rgb565(flipped).reshape((64, 3)).tolist()
 
     def set_pixels(self, pixel_list):
         """
@@ -324,20 +546,8 @@ class SenseHat:
         if len(pixel_list) != 64:
             raise ValueError('Pixel lists must have 64 elements')
 
-        for index, pix in enumerate(pixel_list):
-            if len(pix) != 3:
-                raise ValueError('Pixel at index %d is invalid. Pixels must contain 3 elements: Red, Green and Blue' % index)
-
-            for element in pix:
-                if element > 255 or element < 0:
-                    raise ValueError('Pixel at index %d is invalid. Pixel elements must be between 0 and 255' % index)
-
-        with open(self._fb_device, 'rb+') as f:
-            map = self._pix_map[self._rotation]
-            for index, pix in enumerate(pixel_list):
-                # Two bytes per pixel in fb memory, 16 bit RGB565
-                f.seek(map[index // 8][index % 8] * 2)  # row, column
-                f.write(self._pack_bin(pix))
+        pixels = self._check_pixels(pixel_list)
+        self._write_frame(pack_rgb565(pixels).reshape((8, 8)))
 
     def get_pixels(self):
         """
@@ -345,15 +555,38 @@ class SenseHat:
         representing what is currently displayed on the LED matrix
         """
 
-        pixel_list = []
-        with open(self._fb_device, 'rb') as f:
-            map = self._pix_map[self._rotation]
-            for row in range(8):
-                for col in range(8):
-                    # Two bytes per pixel in fb memory, 16 bit RGB565
-                    f.seek(map[row][col] * 2)  # row, column
-                    pixel_list.append(self._unpack_bin(f.read(2)))
-        return pixel_list
+        return self.get_pixels_array().reshape((64, 3)).tolist()
+
+    def set_pixels_array(self, pixels):
+        """
+        Accepts an (8, 8, 3) array of R,G,B values (indexed by row, then
+        column) and updates the LED matrix. Elements must be integers between
+        0 and 255; :class:`numpy.uint8` arrays are used without any further
+        validation.
+
+        Alternatively, *pixels* may be a bytes-like object containing 64
+        native-order 16-bit RGB565 values (128 bytes) in row-major order, as
+        returned by :meth:`get_pixels_array` with *raw* set.
+        """
+
+        self._write_frame(self._pack_array(pixels))
+
+    def get_pixels_array(self, raw=False):
+        """
+        Returns an (8, 8, 3) :class:`numpy.uint8` array of R,G,B values,
+        indexed by row then column, representing what is currently displayed
+        on the LED matrix.
+
+        If *raw* is ``True``, a :class:`bytes` object containing 64
+        native-order 16-bit RGB565 values in row-major order is returned
+        instead.
+        """
+
+        packed = self._read_frame()
+        if raw:
+            return packed.tobytes()
+        else:
+            return unpack_rgb565(packed)
 
     def set_pixel(self, x, y, *args):
         """
@@ -387,11 +620,10 @@ class SenseHat:
             if element > 255 or element < 0:
                 raise ValueError('Pixel elements must be between 0 and 255')
 
-        with open(self._fb_device, 'rb+') as f:
-            map = self._pix_map[self._rotation]
-            # Two bytes per pixel in fb memory, 16 bit RGB565
-            f.seek(map[y][x] * 2)  # row, column
-            f.write(self._pack_bin(pixel))
+        map = self._pix_map[self._rotation]
+        # One 16 bit RGB565 value per pixel in fb memory
+        with self._fb_draw() as frame:
+            frame.reshape(64)[map[y][x]] = self._pack_bin(pixel)  # row, column
 
     def get_pixel(self, x, y):
         """
@@ -405,33 +637,86 @@ class SenseHat:
         if y > 7 or y < 0:
             raise ValueError('Y position must be between 0 and 7')
 
-        pix = None
+        map = self._pix_map[self._rotation]
+        # One 16 bit RGB565 value per pixel in fb memory
+        return self._unpack_bin(self._frame.reshape(64)[map[y][x]])  # row, column
+
+    def _decode_image(self, file_path, mtime):
+        """
+        Internal. Decodes every frame of the image at *file_path* into a
+        read-only (N, height, width, 3) array of R,G,B values. If the image is
+        8 x 8, a read-only (N, 8, 8) array of the frames packed into RGB565
+        values is also returned (otherwise ``None``). Calls are cached by
+        *file_path* and *mtime*, so a modified file is decoded again
+        """
+
+        with Image.open(file_path) as img:
+            frames = np.stack([
+                np.array(frame.convert('RGB'), dtype=np.uint8)
+                for frame in ImageSequence.Iterator(img)
+            ])
+        frames.flags.writeable = False
+        if frames.shape[1:3] == (8, 8):
+            packed = pack_rgb565(frames)
+            packed.flags.writeable = False
+        else:
+            packed = None
+        return frames, packed
 
-        with open(self._fb_device, 'rb') as f:
-            map = self._pix_map[self._rotation]
-            # Two bytes per pixel in fb memory, 16 bit RGB565
-            f.seek(map[y][x] * 2)  # row, column
-            pix = self._unpack_bin(f.read(2))
+    def _load_image(self, file_path):
+        """
+        Internal. Returns the (cached) decoded frames of the image at
+        *file_path*, see :meth:`_decode_image`
+        """
 
-        return pix
+        file_path = os.path.abspath(file_path)
+        try:
+            mtime = os.stat(file_path).st_mtime_ns
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                raise IOError('%s not found' % file_path)
+            raise
+        return self._image_cache(file_path, mtime)
 
     def load_image(self, file_path, redraw=True):
         """
         Accepts a path to an 8 x 8 image file and updates the LED matrix with
         the image
-        """
 
-        if not os.path.exists(file_path):
-            raise IOError('%s not found' % file_path)
+        Decoded images are cached, so loading the same (unmodified) file again
+        is cheap. For animated images, the first frame is loaded; see
+        :meth:`load_frames` to load all of them.
+        """
 
-        img = Image.open(file_path).convert('RGB')
-        pixel_list = list(map(list, img.getdata()))
+        frames, packed = self._load_image(file_path)
+        pixel_list = frames[0].reshape((-1, 3)).tolist()
 
         if redraw:
-            self.set_pixels(pixel_list)
+            if packed is None:
+                self.set_pixels(pixel_list)
+            else:
+                self._write_frame(packed[0])
 
         return pixel_list
 
+    def load_frames(self, file_path):
+        """
+        Returns an (N, 8, 8, 3) :class:`numpy.uint8` array of R,G,B values
+        containing all N frames of the 8 x 8 image file at *file_path*. This is
+        intended for animated GIF or PNG files, and the result can be passed
+        straight to :meth:`play_frames`. For example::
+
+            hat.play_frames(hat.load_frames('spinner.gif'), fps=10, loop=True)
+
+        Decoded images are cached, so loading the same (unmodified) file again
+        is cheap.
+        """
+
+        frames, packed = self._load_image(file_path)
+        if packed is None:
+            raise ValueError('Image must be 8 x 8 pixels')
+        return frames.copy()
+
     def clear(self, *args):
         """
         Clears the LED matrix with a single colour, default is black / off
@@ -455,7 +740,10 @@ class SenseHat:
         else:
             raise ValueError('Pixel arguments must be given as (r, g, b) or r, g, b')
 
-        self.set_pixels([colour] * 64)
+        # Rotation is irrelevant when every pixel is the same colour
+        packed = pack_rgb565(self._check_pixels([colour]))[0]
+        with self._fb_draw() as frame:
+            frame[...] = packed
 
     def _get_char_pixels(self, s):
         """
@@ -464,51 +752,87 @@ class SenseHat:
         """
 
         if len(s) == 1 and s in self._text_dict.keys():
-            return list(self._text_dict[s])
+            return self._text_dict[s]
         else:
-            return list(self._text_dict['?'])
+            return self._text_dict['?']
+
+    def _render_text(self, text_string, text_colour, back_colour, scroll):
+        """
+        Internal. Renders *text_string* in the specified colours as an array of
+        RGB565 values, rotated to be drawn as-is. If *scroll* is ``True``, the
+        result is an 8 x N strip of trimmed characters padded with a screen's
+        width of background at either end for show_message to scroll across.
+        Otherwise, the result is an 8 x 8 frame for show_letter. Results are
+        cached (see _load_text_assets) so must not be modified
+        """
+
+        if scroll:
+            # Build the strip from one padding row after each trimmed
+            # character, plus the string padding
+            rows = [np.zeros((8, 8), dtype=bool)]
+            for s in text_string:
+                rows.append(self._trim_whitespace(self._get_char_pixels(s)))
+                rows.append(np.zeros((1, 8), dtype=bool))
+            rows.append(np.zeros((8, 8), dtype=bool))
+        else:
+            rows = [
+                np.zeros((1, 8), dtype=bool),
+                self._get_char_pixels(text_string),
+                np.zeros((2, 8), dtype=bool),
+            ]
+        # We must rotate the text left through 90 degrees, see
+        # _load_text_assets
+        mask = np.rot90(np.concatenate(rows))
+        text, back = pack_rgb565(self._check_pixels([text_colour, back_colour]))
+        result = np.where(mask, text, back)
+        result.flags.writeable = False
+        return result
+
+    def _play(self, frames, interval):
+        """
+        Internal. Cancels any running frame player, and starts a new one
+        drawing *frames* (an iterable of 8 x 8 arrays of RGB565 values) at
+        *interval* second intervals
+        """
+
+        if self._player is not None:
+            self._player.cancel()
+        self._player = FramePlayer(self._write_frame, frames, interval)
+        return self._player
 
     def show_message(
             self,
             text_string,
             scroll_speed=.1,
             text_colour=[255, 255, 255],
-            back_colour=[0, 0, 0]
+            back_colour=[0, 0, 0],
+            background=False
         ):
         """
         Scrolls a string of text across the LED matrix using the specified
         speed and colours
-        """
 
-        # We must rotate the pixel map left through 90 degrees when drawing
-        # text, see _load_text_assets
-        previous_rotation = self._rotation
-        self._rotation -= 90
-        if self._rotation < 0:
-            self._rotation = 270
-        dummy_colour = [None, None, None]
-        string_padding = [dummy_colour] * 64
-        letter_padding = [dummy_colour] * 8
-        # Build pixels from dictionary
-        scroll_pixels = []
-        scroll_pixels.extend(string_padding)
-        for s in text_string:
-            scroll_pixels.extend(self._trim_whitespace(self._get_char_pixels(s)))
-            scroll_pixels.extend(letter_padding)
-        scroll_pixels.extend(string_padding)
-        # Recolour pixels as necessary
-        coloured_pixels = [
-            text_colour if pixel == [255, 255, 255] else back_colour
-            for pixel in scroll_pixels
-        ]
-        # Shift right by 8 pixels per frame to scroll
-        scroll_length = len(coloured_pixels) // 8
-        for i in range(scroll_length - 8):
-            start = i * 8
-            end = start + 64
-            self.set_pixels(coloured_pixels[start:end])
-            time.sleep(scroll_speed)
-        self._rotation = previous_rotation
+        If *background* is ``False`` (the default), the method returns when
+        the message has finished scrolling. If it is ``True``, the method
+        returns immediately and the message scrolls from a background thread.
+        Either way, a :class:`FramePlayer` is returned which can be used to
+        wait for, or cancel, the scrolling. Showing another message or letter
+        replaces any message that is still scrolling.
+        """
+
+        strip = self._text_cache(
+            text_string, tuple(text_colour), tuple(back_colour), True)
+        # Shift right by 1 pixel per frame to scroll
+        player = self._play(
+            (strip[:, i:i + 8] for i in range(strip.shape[1] - 8)),
+            scroll_speed)
+        if not background:
+            try:
+                player.wait()
+            finally:
+                if not player.done:
+                    player.cancel()
+        return player
 
     def show_letter(
             self,
@@ -523,28 +847,49 @@ class SenseHat:
 
         if len(s) > 1:
             raise ValueError('Only one character may be passed into this method')
-        # We must rotate the pixel map left through 90 degrees when drawing
-        # text, see _load_text_assets
-        previous_rotation = self._rotation
-        self._rotation -= 90
-        if self._rotation < 0:
-            self._rotation = 270
-        dummy_colour = [None, None, None]
-        pixel_list = [dummy_colour] * 8
-        pixel_list.extend(self._get_char_pixels(s))
-        pixel_list.extend([dummy_colour] * 16)
-        coloured_pixels = [
-            text_colour if pixel == [255, 255, 255] else back_colour
-            for pixel in pixel_list
-        ]
-        self.set_pixels(coloured_pixels)
-        self._rotation = previous_rotation
+        if self._player is not None:
+            self._player.cancel()
+        self._write_frame(self._text_cache(
+            s, tuple(text_colour), tuple(back_colour), False))
+
+    def play_frames(self, frames, fps, loop=False):
+        """
+        Plays a sequence of frames on the LED matrix at *fps* frames per
+        second from a background thread, returning a :class:`FramePlayer`
+        immediately. Playing frames replaces any message or animation that is
+        still running.
+
+        The *frames* may be a numpy array with the shape (N, 8, 8, 3), which is
+        validated and converted to the display's native format once before
+        playback starts, or any iterable of frames acceptable to
+        :meth:`set_pixels_array`, which are converted as they are played. If
+        *loop* is ``True``, the frames repeat until the player is cancelled
+        (frames from an iterable are kept after their first showing so they
+        are only converted once).
+
+        If playback falls behind, frames are skipped rather than played late;
+        the number skipped is reported by :attr:`FramePlayer.dropped`.
+        """
+
+        if fps <= 0:
+            raise ValueError('fps must be greater than 0')
+        if isinstance(frames, np.ndarray):
+            if frames.ndim != 4 or frames.shape[1:] != (8, 8, 3):
+                raise ValueError('Frame arrays must have the shape (N, 8, 8, 3)')
+            if frames.dtype != np.uint8:
+                if frames.size and (frames.min() < 0 or frames.max() > 255):
+                    raise ValueError('Pixel elements must be between 0 and 255')
+                frames = frames.astype(np.uint8)
+            packed = pack_rgb565(frames)
+        else:
+            packed = map(self._pack_array, frames)
+        if loop:
+            packed = cycle(packed)
+        return self._play(packed, 1 / fps)
 
     @property
     def gamma(self):
-        with open(self._fb_device, 'rb') as f:
-            f.seek(128)
-            return struct.unpack('32B', f.read(32))
+        return tuple(self._fb_gamma.tolist())
 
     @gamma.setter
     def gamma(self, buffer):
@@ -554,12 +899,8 @@ class SenseHat:
         if not all(b <= 31 for b in buffer):
             raise ValueError('Gamma values must be bewteen 0 and 31')
 
-        if not isinstance(buffer, array.array):
-            buffer = array.array('B', buffer)
-
-        with open(self._fb_device, 'rb+') as f:
-            f.seek(128)
-            f.write(struct.pack('32B', *buffer))
+        with self._fb_update():
+            self._fb_gamma[:] = buffer
 
     def gamma_reset(self):
         """
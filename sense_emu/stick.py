@@ -25,12 +25,16 @@ import struct
 import select
 import inspect
 import socket
+import zlib
+import warnings
 from functools import wraps
 from collections import namedtuple
 from threading import Thread, Event
 from queue import Queue, Empty
 from time import sleep
 
+from .common import instance_name, shared_filename
+
 
 DIRECTION_UP     = 'up'
 DIRECTION_DOWN   = 'down'
@@ -68,48 +72,76 @@ class InputEvent(namedtuple('InputEvent', ('timestamp', 'direction', 'action')))
     """
 
 
-def stick_address():
+def stick_address(instance=None):
     """
     Return the socket address used represent the state of the emulated sense
-    HAT's joystick. On UNIX we try ``/dev/shm`` then fall back to ``/tmp``
-    (UNIX sockets); on Windows we use localhost.
+    HAT's joystick of the emulator *instance*. On UNIX this is a socket
+    alongside the instance's other shared files (see
+    :func:`~sense_emu.common.shared_filename`); on Windows we use localhost.
     """
-    fname = 'rpi-sense-emu-stick'
+    instance = instance_name(instance)
     if sys.platform.startswith('win'):
-        # use UDP sockets on Windows
-        return (socket.AF_INET, socket.SOCK_DGRAM, ('127.0.0.1', 53753))
+        # use UDP sockets on Windows; named instances use a port derived from
+        # their name
+        port = 53753
+        if instance:
+            port += 1 + zlib.crc32(instance.encode('ascii')) % 1000
+        return (socket.AF_INET, socket.SOCK_DGRAM, ('127.0.0.1', port))
     else:
         # use UNIX sockets everywhere else
-        if os.path.exists('/dev/shm'):
-            return (socket.AF_UNIX, socket.SOCK_DGRAM, os.path.join('/dev/shm', fname))
-        else:
-            return (socket.AF_UNIX, socket.SOCK_DGRAM, os.path.join('/tmp', fname))
+        return (socket.AF_UNIX, socket.SOCK_DGRAM, shared_filename('-stick', instance))
 
 
-def init_stick_client():
+def stick_client_prefix(instance=None):
     """
-    Opens a socket representing the state of the joystick as a series of evdev
-    events. A file-like object is returned (readable like the character device
-    representing the real joystick).
+    Return the path prefix of the sockets bound by clients of the emulated
+    sense HAT's joystick of the emulator *instance* (each client appends its
+    PID), or ``None`` on Windows where clients bind an ephemeral port instead.
+    """
+    if sys.platform.startswith('win'):
+        return None
+    else:
+        return shared_filename('-client-', instance)
+
+
+def stick_hello(instance=None):
+    """
+    Return the message with which clients of the joystick of the emulator
+    *instance* register with its server. This names the instance so that a
+    server can recognize (and report) clients of another instance whose
+    address clashes with its own.
+    """
+    instance = instance_name(instance)
+    if instance:
+        return b'hello ' + instance.encode('ascii')
+    else:
+        return b'hello'
+
+
+def init_stick_client(instance=None):
+    """
+    Opens a socket representing the state of the joystick of the emulator
+    *instance* as a series of evdev events. A file-like object is returned
+    (readable like the character device representing the real joystick).
 
     A background thread is spawned to take care of connecting to the stick
     server (and to automatically handle re-connections in the case of
     termination). The thread is marked as a daemon thread so it won't prevent
     script shutdown.
     """
-    family, sock_type, addr = stick_address()
+    family, sock_type, addr = stick_address(instance)
+    hello = stick_hello(instance)
     client = socket.socket(family, sock_type)
     if family == socket.AF_INET:
         client.bind(('127.0.0.1', 0))
     elif family == socket.AF_UNIX:
-        fname = 'rpi-sense-emu-client-%d' % os.getpid()
-        addr_path = os.path.dirname(addr)
+        client_addr = '%s%d' % (stick_client_prefix(instance), os.getpid())
         try:
-            os.unlink(os.path.join(addr_path, fname))
+            os.unlink(client_addr)
         except OSError as e:
             if e.errno != errno.ENOENT:
                 raise
-        client.bind(os.path.join(addr_path, fname))
+        client.bind(client_addr)
     if not client.getsockname():
         raise RuntimeError('Failed to create client socket for stick emulation')
     # Start up a background thread which persistently attempts to connect to
@@ -120,7 +152,7 @@ def init_stick_client():
         while True:
             try:
                 client.connect(addr)
-                client.send(b'hello')
+                client.send(hello)
             except socket.error as e:
                 if e.errno not in (errno.ENOENT, errno.ENOTCONN, errno.ECONNREFUSED):
                     raise
@@ -135,7 +167,8 @@ def init_stick_client():
 
 class SenseStick:
     """
-    Represents the joystick on the Sense HAT.
+    Represents the joystick on the Sense HAT. The *instance* parameter
+    selects the emulator instance, as for :class:`SenseHat`.
     """
     SENSE_HAT_EVDEV_NAME = 'Raspberry Pi Sense HAT Joystick'
     EVENT_FORMAT = 'llHHI'
@@ -153,7 +186,8 @@ class SenseStick:
     KEY_DOWN = 108
     KEY_ENTER = 28
 
-    def __init__(self):
+    def __init__(self, instance=None):
+        self._instance = instance
         self._stick_file = self._stick_device()
         self._callbacks = {}
         self._callback_thread = None
@@ -177,7 +211,7 @@ class SenseStick:
         Discovers the filename of the evdev device that represents the Sense
         HAT's joystick.
         """
-        return init_stick_client()
+        return init_stick_client(self._instance)
 
     def _read(self):
         """
@@ -407,8 +441,9 @@ class SenseStick:
 
 
 class StickServer:
-    def __init__(self):
-        family, sock_type, addr = stick_address()
+    def __init__(self, instance=None):
+        self._instance = instance_name(instance)
+        family, sock_type, addr = stick_address(self._instance)
         server = socket.socket(family, sock_type)
         if family == socket.AF_UNIX:
             try:
@@ -416,7 +451,19 @@ class StickServer:
                 os.unlink(addr)
             except OSError:
                 pass
-        server.bind(addr)
+        try:
+            server.bind(addr)
+        except socket.error as e:
+            server.close()
+            if e.errno in (errno.EADDRINUSE, getattr(errno, 'WSAEADDRINUSE', None)):
+                # On Windows, the ports of named instances are derived from
+                # their names and may clash with each other (or anything else)
+                raise IOError(
+                    e.errno,
+                    'joystick address %r of emulator instance %r is already '
+                    'in use; is another instance with a clashing name '
+                    'running? (try another name)' % (addr, self._instance))
+            raise
         self._stop = Event()
         self._queue = Queue()
         self._thread = Thread(target=self._serve, args=(server,))
@@ -425,13 +472,26 @@ class StickServer:
 
     def _serve(self, server):
         try:
+            hello = stick_hello(self._instance)
             clients = set()
+            strangers = set()
             while not self._stop.wait(0):
-                # Pick up any new clients waiting to receive events
+                # Pick up any new clients waiting to receive events; clients
+                # of another instance can only reach us if its address
+                # clashes with ours (see stick_address), in which case they
+                # are reported (once) and ignored
                 while select.select([server], [], [], 0)[0]:
                     data, addr = server.recvfrom(64)
-                    if data == b'hello':
+                    if data == hello:
                         clients.add(addr)
+                    elif data.startswith(b'hello') and addr not in strangers:
+                        strangers.add(addr)
+                        warnings.warn(Warning(
+                            'Ignoring joystick client %r of another emulator '
+                            'instance (%r) whose address clashes with that '
+                            'of instance %r' % (
+                                addr, data[6:].decode('ascii', 'replace'),
+                                self._instance)))
                 try:
                     # Grab any data waiting to be sent to clients; we put the
                     # only pause for the thread here to ensure timely response